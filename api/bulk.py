@@ -0,0 +1,84 @@
+"""
+Helpers for writing many rows at once. Django 1.10 only ships with
+bulk_create, so anything that needs to touch existing rows in bulk lives here.
+"""
+from __future__ import absolute_import, unicode_literals
+from django.db import connection
+from django.db.models import AutoField, Case, Value, When
+from django.db.models.functions import Cast
+
+#: Number of rows to update per UPDATE statement
+BATCH_SIZE = 500
+
+
+def bulk_update(objs, fields, batch_size=BATCH_SIZE):
+    """
+    Saves the given fields of every object in objs using one UPDATE statement
+    per batch, instead of one per object. All objects must be saved instances
+    of the same model. Returns the number of rows updated.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+
+    model = type(objs[0])
+    fields = [model._meta.get_field(name) for name in fields]
+    updated = 0
+
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+
+        for field in fields:
+            # Postgres cannot infer the type of bare CASE parameters, so the
+            # whole expression is cast to the column type.
+            whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname),
+                                                output_field=field))
+                     for obj in batch]
+            updates[field.attname] = Cast(Case(*whens, output_field=field),
+                                          output_field=field)
+
+        pks = [obj.pk for obj in batch]
+        updated += model._default_manager.filter(pk__in=pks).update(**updates)
+
+    return updated
+
+
+def bulk_insert_ignoring_conflicts(objs, batch_size=BATCH_SIZE):
+    """
+    Inserts the given unsaved objects like bulk_create, except that objects
+    conflicting with an existing row on a unique constraint are skipped, with
+    INSERT ... ON CONFLICT DO NOTHING. Another transaction may have inserted
+    the same rows concurrently, so callers should select the rows again
+    afterwards rather than use the objects. Returns the number of rows
+    inserted.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+
+    model = type(objs[0])
+    fields = [field for field in model._meta.concrete_fields
+              if not isinstance(field, AutoField)]
+    columns = ', '.join(connection.ops.quote_name(field.column)
+                        for field in fields)
+    row = '(%s)' % ', '.join(['%s'] * len(fields))
+    inserted = 0
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [field.get_db_prep_save(field.pre_save(obj, True),
+                                             connection)
+                      for obj in batch for field in fields]
+            cursor.execute(
+                'INSERT INTO %s (%s) VALUES %s ON CONFLICT DO NOTHING' % (
+                    connection.ops.quote_name(model._meta.db_table),
+                    columns,
+                    ', '.join([row] * len(batch)),
+                ),
+                params,
+            )
+            inserted += cursor.rowcount
+
+    return inserted
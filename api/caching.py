@@ -0,0 +1,145 @@
+"""
+Caching of API responses. Data only changes when the scrapers run, so
+responses are cached until the import tasks bump the generation of the term
+they wrote to. Responses to requests scoped to a term with ?term= depend on
+that term's generation only, and everything else on the global generation,
+which every import bumps. The same versions are given to clients as ETags,
+so they can revalidate what they already have.
+"""
+from __future__ import absolute_import, unicode_literals
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+import hashlib
+import time
+
+
+def generation_key(term_code=None):
+    if term_code is None:
+        return 'api:generation'
+    return 'api:generation:%s' % term_code
+
+
+def initial_generation():
+    # Start from the clock rather than 0, so that a generation that was
+    # evicted from the cache never comes back with a number already used
+    return int(time.time() * 1000)
+
+
+def get_generation(term_code=None):
+    """Returns the current generation of the given term, or of all terms."""
+    key = generation_key(term_code)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, initial_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(term_code=None):
+    """
+    Invalidates every cached response that depends on the given term, which
+    includes every response that isn't scoped to a term. Only invalidates the
+    latter if no term is given.
+    """
+    keys = [generation_key()]
+    if term_code is not None:
+        keys.append(generation_key(term_code))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:  # not cached yet, so nothing to invalidate
+            cache.add(key, initial_generation(), None)
+
+
+def request_hash(request, version):
+    """
+    Hashes everything the response to the given request depends on: its
+    path, query string and accepted formats, and the version of the data.
+    """
+    params = sorted((name, value.encode('utf-8'))
+                    for name, value in request.GET.items())
+    return hashlib.sha1(repr((
+        request.path,
+        params,
+        request.META.get('HTTP_ACCEPT', ''),
+        version,
+    ))).hexdigest()
+
+
+def request_generation(request):
+    """
+    Returns the generation the response to the given request is in: that of
+    its term, if it's scoped to one, and otherwise the global generation.
+    """
+    try:
+        term_code = int(request.GET['term'])
+    except (KeyError, ValueError):
+        term_code = None
+    return get_generation(term_code)
+
+
+def response_cache_key(request):
+    """
+    Returns the key to cache the response to the given request under, in
+    the current generation.
+    """
+    return 'api:response:%s' % request_hash(request,
+                                            request_generation(request))
+
+
+class CachedResponseMixin(object):
+
+    """
+    Caches the successful JSON responses of a read-only viewset until the
+    data they depend on is reimported. Other formats, like the browsable API,
+    aren't cached since they vary by user.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super(CachedResponseMixin, self).dispatch(
+                request, *args, **kwargs)
+
+        key = response_cache_key(request)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = super(CachedResponseMixin, self).dispatch(
+            request, *args, **kwargs)
+        renderer = getattr(response, 'accepted_renderer', None)
+        if response.status_code == 200 and renderer and \
+                renderer.format == 'json':
+            response.render()
+            cache.set(key, response, settings.API_CACHE_TTL)
+        return response
+
+
+class ConditionalGetMixin(object):
+
+    """
+    Gives the responses of a read-only viewset strong ETags, and answers
+    requests for a version the client already has with a 304 before doing
+    any work. Viewsets can override get_version to version their resources
+    more precisely than by generation.
+    """
+
+    def get_version(self, request, *args, **kwargs):
+        """
+        Returns the version of the data the response depends on, or None if
+        the resource doesn't exist.
+        """
+        return request_generation(request)
+
+    def get_etag(self, request, *args, **kwargs):
+        version = self.get_version(request, *args, **kwargs)
+        if version is None:
+            return None
+        return request_hash(request, version)
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super(ConditionalGetMixin, self).dispatch
+        if request.method in ('GET', 'HEAD'):
+            dispatch = condition(etag_func=self.get_etag)(dispatch)
+        return dispatch(request, *args, **kwargs)
@@ -0,0 +1,51 @@
+"""
+Bulk export of courses as NDJSON: one JSON object per line, per course, with
+its sections, meetings, evaluations and advice nested the same way as in the
+API. Courses are fetched in chunks by sort key, so memory use stays constant
+however many courses are exported.
+"""
+from __future__ import absolute_import, unicode_literals
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import CourseSerializer
+
+#: Number of courses to fetch per query
+CHUNK_SIZE = 200
+
+#: Media type of the export
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def chunked(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yields lists of the courses in the given queryset, ordered by sort key.
+    Each chunk is fetched by keyset rather than offset, and prefetches are
+    done per chunk.
+    """
+    queryset = queryset.order_by('sort_key')
+    last_key = None
+    while True:
+        chunk = queryset
+        if last_key is not None:
+            chunk = chunk.filter(sort_key__gt=last_key)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_key = chunk[-1].sort_key
+
+
+def to_json(data):
+    """Renders the given serializer data as compact JSON, in unicode."""
+    # json.dumps returns a str rather than unicode for empty containers
+    return unicode(json.dumps(data, cls=JSONEncoder, ensure_ascii=False,
+                              separators=(',', ':')))
+
+
+def export_courses(queryset, chunk_size=CHUNK_SIZE):
+    """Yields each course in the given queryset as a line of JSON."""
+    for chunk in chunked(queryset, chunk_size):
+        for data in CourseSerializer(chunk, many=True).data:
+            yield to_json(data) + '\n'
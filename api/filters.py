@@ -0,0 +1,97 @@
+"""
+Filters for the easyPCE API.
+"""
+from django.core.validators import RegexValidator
+import django_filters
+from rest_framework.filters import OrderingFilter
+
+import models
+from schedules import DAYS, masks_meeting_on, minutes, parse_days
+
+
+class CourseFilter(django_filters.FilterSet):
+
+    """
+    Filters courses by term code and primary subject code, and by when they
+    meet: ?days= only keeps courses that meet on no other days than those
+    given, like MWF, and ?starts_after= and ?ends_before= only those that
+    meet entirely between the given times, like 11:00. Each of these leaves
+    out every course with a meeting that breaks it, found by index.
+    """
+
+    term = django_filters.NumberFilter(name='term__code')
+    subject = django_filters.CharFilter(name='primary_number__subject__code')
+    days = django_filters.CharFilter(method='filter_days', validators=[
+        RegexValidator(r'^(?:M|T|W|Th|F)+$', 'Enter days like MWF or TTh.'),
+    ])
+    starts_after = django_filters.TimeFilter(method='filter_starts_after')
+    ends_before = django_filters.TimeFilter(method='filter_ends_before')
+
+    class Meta:
+        model = models.Course
+        fields = (
+            'term',
+            'subject',
+            'days',
+            'starts_after',
+            'ends_before',
+        )
+
+    def exclude_meeting(self, queryset, **lookups):
+        """Leaves out the courses with any meeting matching the lookups."""
+        return queryset.exclude(pk__in=models.Meeting.objects.filter(
+            **lookups).values('section__course'))
+
+    def filter_days(self, queryset, name, value):
+        other_days = [day for day in DAYS if day not in parse_days(value)]
+        if not other_days:
+            return queryset
+        return self.exclude_meeting(
+            queryset, day_mask__in=masks_meeting_on(other_days))
+
+    def filter_starts_after(self, queryset, name, value):
+        return self.exclude_meeting(queryset, start_minute__lt=minutes(value))
+
+    def filter_ends_before(self, queryset, name, value):
+        return self.exclude_meeting(queryset, end_minute__gt=minutes(value))
+
+
+class AdviceFilter(django_filters.FilterSet):
+
+    """Filters advice by the term, primary subject and id of its course."""
+
+    term = django_filters.NumberFilter(name='course__term__code')
+    subject = django_filters.CharFilter(
+        name='course__primary_number__subject__code')
+    course = django_filters.CharFilter(name='course__course_id')
+
+    class Meta:
+        model = models.Advice
+        fields = (
+            'term',
+            'subject',
+            'course',
+        )
+
+
+class CourseOrderingFilter(OrderingFilter):
+
+    """
+    Orders courses as requested, leaving out unrated courses when ordering by
+    rating, since Postgres would otherwise sort them first when descending.
+    Ties are broken by the sort key, so that pages are stable.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super(CourseOrderingFilter, self).get_ordering(
+            request, queryset, view)
+        if ordering and 'sort_key' not in ordering:
+            ordering = tuple(ordering) + ('sort_key',)
+        return ordering
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view) or ()
+        if any(field.lstrip('-') == 'rating' for field in ordering):
+            queryset = queryset.filter(rating__isnull=False)
+        return super(CourseOrderingFilter, self).filter_queryset(
+            request, queryset, view)
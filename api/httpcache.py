@@ -0,0 +1,183 @@
+"""
+A disk-backed cache of HTTP responses for the scrapers. Entries are kept
+until the cache grows past its maximum size, at which point the least
+recently used entries are evicted. Whether a cached entry is still fresh is
+up to the caller, since it depends on the endpoint.
+"""
+from __future__ import absolute_import, unicode_literals
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import urllib
+
+#: Fraction of the maximum size to shrink the cache to when evicting, so that
+#: we don't have to evict again on the very next write
+EVICT_TO = 0.9
+
+
+class CacheEntry(object):
+
+    """
+    A cached response, along with the validators needed to make a
+    conditional request for it.
+    """
+
+    def __init__(self, content, headers, stored_at):
+        self.content = content
+        self.headers = headers
+        self.stored_at = stored_at
+
+    @property
+    def etag(self):
+        return self.headers.get('etag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('last-modified')
+
+    def is_fresh(self, ttl):
+        """
+        Returns whether the entry is younger than ttl seconds. A ttl of None
+        means entries never go stale.
+        """
+        return ttl is None or time.time() - self.stored_at < ttl
+
+    def conditional_headers(self):
+        """
+        Returns the headers needed to revalidate this entry with the server.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+
+    """
+    Stores response bodies on disk, keyed by url and query params. Safe to
+    share between threads and processes, since entries are written
+    atomically.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None  # computed lazily, since it requires a full scan
+        self._lock = threading.Lock()
+
+    def path(self, url, params):
+        """Returns the path of the file caching the given request."""
+        query = urllib.urlencode(sorted(params.items()))
+        key = hashlib.sha1((url + '?' + query).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, url, params):
+        """
+        Returns the CacheEntry for the given request, or None if it isn't
+        cached.
+        """
+        path = self.path(url, params)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:  # evicted by someone else in the meantime
+            pass
+        return entry
+
+    def set(self, url, params, content, headers, stored_at=None):
+        """
+        Caches the given response body and headers for the given request,
+        returning the new CacheEntry.
+        """
+        headers = {name.lower(): value for name, value in headers.items()
+                   if name.lower() in ('etag', 'last-modified',
+                                       'content-type')}
+        entry = CacheEntry(content, headers, stored_at or time.time())
+
+        path = self.path(url, params)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # created by someone else in the meantime
+                pass
+
+        # Write to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.rename(tmp_path, path)
+        self._grow(os.path.getsize(path) - old_size)
+
+        return entry
+
+    def delete(self, url, params):
+        """Removes the given request from the cache, if it's cached."""
+        path = self.path(url, params)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:  # not cached, or evicted by someone else
+            return
+        self._grow(-size)
+
+    def touch(self, url, params, entry):
+        """
+        Marks the given entry as just revalidated, so it's fresh again.
+        """
+        return self.set(url, params, entry.content, entry.headers)
+
+    def _entries(self):
+        """Returns (last used, size, path) for every file in the cache."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:  # evicted by someone else
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _grow(self, delta):
+        """
+        Records that the cache grew by delta bytes, evicting the least
+        recently used entries if it's now too big.
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += delta
+
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Evicts least recently used entries until under the limit."""
+        # Other processes share the directory, so rescan to get real sizes
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+
+        for _, size, path in entries:
+            if self._size <= self.max_size * EVICT_TO:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
@@ -0,0 +1,202 @@
+"""
+Offline benchmark of the scrapers and import tasks.
+Usage: python manage.py benchmark [--pages <dir>] [--repeat <n>]
+
+Replays pages from disk through the whole scraping pipeline against a
+throwaway test database, and reports throughput, queries per course and peak
+memory. The pages directory should contain:
+
+- courses.json: a web feeds course offerings response for one subject
+- course_details.html: a registrar course details page
+- evals.html: a course evaluations page
+
+A page for a particular course can be given as details/<course id>.html or
+evals/<course id>.html, and is used instead of the generic one.
+"""
+from contextlib import contextmanager
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.response import HTTPResponse
+import io
+import json
+import os
+import resource
+import time
+import urlparse
+
+from api import scrapers
+from api import tasks
+from api.models import Course, Subject, Term
+
+#: Default directory of pages to replay
+PAGES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                         'fixtures', 'pages')
+
+
+class ReplayAdapter(HTTPAdapter):
+
+    """
+    Answers requests to the scraped sites with pages from disk, instead of
+    going to the network.
+    """
+
+    def __init__(self, pages_dir):
+        super(ReplayAdapter, self).__init__()
+        self.pages_dir = pages_dir
+
+    def page_path(self, url, params):
+        """Returns the path of the page to answer the given request with."""
+        if url == scrapers.FEED_URL:
+            return os.path.join(self.pages_dir, 'courses.json')
+        elif url == scrapers.REGISTRAR_BASE_URL:
+            kind, course_id = 'details', params.get('courseid')
+            default = 'course_details.html'
+        elif url == scrapers.EVALUATION_BASE_URL:
+            kind, course_id = 'evals', params.get('courseinfo')
+            default = 'evals.html'
+        else:
+            raise ValueError('no pages to replay for %s' % url)
+
+        path = os.path.join(self.pages_dir, kind, '%s.html' % course_id)
+        if not os.path.exists(path):
+            path = os.path.join(self.pages_dir, default)
+        return path
+
+    def send(self, request, **kwargs):
+        url = urlparse.urlsplit(request.url)
+        base_url = '%s://%s%s' % (url.scheme, url.netloc, url.path)
+        params = dict(urlparse.parse_qsl(url.query))
+
+        with open(self.page_path(base_url, params), 'rb') as f:
+            body = f.read()
+
+        raw = HTTPResponse(body=io.BytesIO(body), status=200,
+                           preload_content=False)
+        return self.build_response(request, raw)
+
+
+@contextmanager
+def without_queueing(task):
+    """Drops any calls to task.delay within the block."""
+    delay = task.delay
+    task.delay = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        task.delay = delay
+
+
+def peak_memory():
+    """Returns the peak memory usage of this process, in megabytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the scrapers and import tasks against saved pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', default=PAGES_DIR,
+                            help='directory of pages to replay')
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='number of times to parse each page')
+
+    def report(self, name, count, unit, elapsed, queries=None, courses=None):
+        """
+        Writes a line reporting the throughput of a benchmark, and the
+        number of queries it made per course, if given.
+        """
+        line = '%-40s %6d %-7s %8.3fs %9.1f %s/sec' % (
+            name, count, unit, elapsed, count / elapsed, unit)
+        if queries is not None:
+            line += ' %7.2f queries/course' % (
+                float(queries) / (courses or count))
+        self.stdout.write(line)
+
+    def benchmark_parsers(self, pages_dir, repeat):
+        """Time parsing the details and evals pages with each parser."""
+        pages = [
+            (scrapers.parse_course_details, 'course_details.html'),
+            (scrapers.parse_evals, 'evals.html'),
+        ]
+        for parse, name in pages:
+            with open(os.path.join(pages_dir, name), 'rb') as f:
+                page = f.read()
+
+            for parser in ('lxml', 'html5lib'):
+                with override_settings(SCRAPER_PARSER=parser):
+                    start = time.time()
+                    for _ in range(repeat):
+                        parse(page)
+                    self.report('%s (%s)' % (parse.__name__, parser),
+                                repeat, 'pages', time.time() - start)
+
+    def benchmark_imports(self, pages_dir):
+        """Time importing a subject and its pages from scratch, then again."""
+        with open(os.path.join(pages_dir, 'courses.json'), 'rb') as f:
+            term_data = json.load(f)['term'][0]
+
+        Term.objects.create(
+            code=term_data['code'],
+            suffix=term_data['suffix'],
+            name=term_data['cal_name'],
+            start_date=term_data['start_date'],
+            end_date=term_data['end_date'],
+        )
+        for subject_data in term_data['subjects']:
+            Subject.objects.create(code=subject_data['code'],
+                                   name=subject_data['name'])
+            for course_data in subject_data['courses']:
+                for xlist_data in course_data.get('cross_listings', []):
+                    Subject.objects.get_or_create(
+                        code=xlist_data['subject'],
+                        defaults={'name': xlist_data['subject']},
+                    )
+
+        term_code = term_data['code']
+        subj_code = term_data['subjects'][0]['code']
+
+        start = time.time()
+        courses = list(scrapers.scrape_courses(term_code, subj_code))
+        self.report('scrape_courses', len(courses), 'courses',
+                    time.time() - start)
+
+        # Time the subject import alone, then the pages it would queue
+        for run in ('initial', 'unchanged'):
+            with without_queueing(tasks.import_course_pages), \
+                    CaptureQueriesContext(connection) as queries:
+                start = time.time()
+                tasks.import_courses_in_subject(term_code, subj_code)
+                self.report('import_courses_in_subject (%s)' % run,
+                            len(courses), 'courses', time.time() - start,
+                            len(queries))
+
+        course_ids = list(Course.objects.values_list('course_id', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            tasks.import_course_pages(term_code, course_ids, course_ids)
+            self.report('import_course_pages', len(course_ids) * 2, 'pages',
+                        time.time() - start, len(queries), len(course_ids))
+
+    def handle(self, *args, **options):
+        pages_dir = options['pages']
+
+        # Serve every request from disk, without caching the responses
+        adapter = ReplayAdapter(pages_dir)
+        session = scrapers.get_session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        self.benchmark_parsers(pages_dir, options['repeat'])
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            with override_settings(SCRAPER_CACHE_DIR=''):
+                self.benchmark_imports(pages_dir)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write('peak memory: %.1f MB' % peak_memory())
@@ -0,0 +1,36 @@
+"""
+Exports the courses of a term as NDJSON.
+Usage: python manage.py export <term code> [--output <file>]
+
+Writes one line of JSON per course, with its sections, meetings, evaluations
+and advice nested as in the API, in constant memory.
+"""
+from django.core.management.base import BaseCommand, CommandError
+import io
+
+from api.export import export_courses
+from api.models import Term
+from api.views import CourseViewSet
+
+
+class Command(BaseCommand):
+    help = 'Exports the courses of a term as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('term', type=int, help='code of the term')
+        parser.add_argument('--output', default='-',
+                            help='file to write to, standard output if -')
+
+    def handle(self, *args, **options):
+        try:
+            term = Term.objects.get(code=options['term'])
+        except Term.DoesNotExist:
+            raise CommandError('term %s does not exist' % options['term'])
+
+        lines = export_courses(CourseViewSet.queryset.filter(term=term))
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with io.open(options['output'], 'w', encoding='utf-8') as f:
+                f.writelines(lines)
@@ -0,0 +1,144 @@
+"""
+Exports every evaluation as compressed NumPy arrays, for analytics.
+Usage: python manage.py export_evals <dir> [--incremental] [--chunk-size <n>]
+
+Writes one <term code>.npz file per term to the given directory, each
+holding one array per column, and a manifest.json recording the version of
+each term exported. With --incremental, only terms that were reimported since
+the last export are written again. Load a term with numpy.load(path).
+
+Rows are read from a server-side cursor a chunk at a time, rather than
+having the database send a whole term at once.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+import json
+import os
+import tempfile
+
+from api.models import Course, Term, canonical_question
+
+#: Name of the file recording which terms were exported, and their versions
+MANIFEST = 'manifest.json'
+
+# Evaluations joined to their course, term, primary number and instructors
+EVALUATIONS_SQL = """
+SELECT c.course_id, t.code, s.code, n.number, c.title,
+    (SELECT string_agg(i.first_name || ' ' || i.last_name, '; '
+                       ORDER BY i.last_name, i.first_name)
+     FROM api_course_instructors ci
+     JOIN api_instructor i ON i.id = ci.instructor_id
+     WHERE ci.course_id = c.id),
+    e.question_text, e.response_avg
+FROM api_evaluation e
+JOIN api_course c ON c.id = e.course_id
+JOIN api_term t ON t.id = c.term_id
+JOIN api_coursenumber n ON n.id = c.primary_number_id
+JOIN api_subject s ON s.id = n.subject_id
+WHERE c.term_id = %s
+ORDER BY c.sort_key, e.question_text
+"""
+
+#: Names of the arrays written, in the order of the query's columns, with the
+#: canonical question added last
+COLUMNS = ('course_id', 'term', 'subject', 'number', 'title', 'instructors',
+           'question_text', 'response_avg', 'question')
+
+
+class Command(BaseCommand):
+    help = 'Exports every evaluation as compressed NumPy arrays.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='directory to write to')
+        parser.add_argument('--incremental', action='store_true',
+                            help='only export terms changed since last time')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='number of rows to fetch at a time')
+
+    def read_manifest(self, directory):
+        try:
+            with open(os.path.join(directory, MANIFEST)) as f:
+                return json.load(f)
+        except IOError:
+            return {}
+
+    def write_manifest(self, directory, manifest):
+        with open(os.path.join(directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+    def read_term(self, term, chunk_size):
+        """Returns the evaluations of the given term, as lists by column."""
+        columns = {name: [] for name in COLUMNS}
+
+        # Named cursors only live as long as their transaction
+        with transaction.atomic():
+            connection.ensure_connection()
+            cursor = connection.connection.cursor(
+                name='export_evals_%s' % term.code)
+            cursor.itersize = chunk_size
+            try:
+                cursor.execute(EVALUATIONS_SQL, [term.pk])
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        for name, value in zip(COLUMNS, row):
+                            columns[name].append(value)
+                        columns['question'].append(canonical_question(row[6]))
+            finally:
+                cursor.close()
+
+        columns['instructors'] = [names or '' for names in
+                                  columns['instructors']]
+        return columns
+
+    def write_term(self, numpy, directory, term, columns):
+        """Writes the given columns of a term, replacing any previous file."""
+        dtypes = {'term': numpy.int16, 'response_avg': numpy.float32}
+        arrays = {
+            name: numpy.array(values, dtype=dtypes.get(name, numpy.unicode_))
+            for name, values in columns.items()
+        }
+
+        # Write to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            numpy.savez_compressed(f, **arrays)
+        os.rename(tmp_path, os.path.join(directory, '%s.npz' % term.code))
+
+    def handle(self, *args, **options):
+        try:
+            import numpy
+        except ImportError:
+            raise CommandError('numpy is required to export evaluations')
+
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        manifest = self.read_manifest(directory) if options['incremental'] \
+            else {}
+
+        # A term's version is the last time any of its courses was updated
+        versions = dict(Course.objects.values_list('term__code').annotate(
+            Max('last_updated')))
+
+        for term in Term.objects.order_by('code'):
+            key = str(term.code)
+            version = versions.get(term.code)
+            version = version.isoformat() if version else None
+            if key in manifest and manifest[key]['version'] == version:
+                continue
+
+            columns = self.read_term(term, options['chunk_size'])
+            self.write_term(numpy, directory, term, columns)
+            manifest[key] = {
+                'file': '%s.npz' % term.code,
+                'rows': len(columns['course_id']),
+                'version': version,
+            }
+            self.write_manifest(directory, manifest)
+            self.stdout.write('exported %d evaluations in term %s'
+                              % (manifest[key]['rows'], term.code))
@@ -1,6 +1,6 @@
 """
 Managment gateway into the scraper mechansim.
-Usage: python manage.py scrape [--meta | --term <termid>]
+Usage: python manage.py scrape [--meta | --term <termid>] [--force]
 """
 from django.core.management.base import BaseCommand, CommandError
 import celery
@@ -22,7 +22,8 @@ class Command(BaseCommand):
                             help='scrape the term and subject meta')
         parser.add_argument('--terms', nargs='+', metavar='term',
                             help='scrape all the provided term codes')
-        # TODO: incremental
+        parser.add_argument('--force', action='store_true',
+                            help='reimport courses even if they are unchanged')
 
     def handle(self, *args, **options):
         task_q = []
@@ -38,8 +39,10 @@ class Command(BaseCommand):
 
         if options['terms'] or options['all']:
             terms = options['terms'] if not options['all'] else all_terms()
-            task_q.append(celery.group([tasks.import_courses_in_term.s(t)
-                                        for t in terms]))
+            task_q.append(celery.group([
+                tasks.import_courses_in_term.s(t, options['force'])
+                for t in terms
+            ]))
 
         celery.chain(task_q)()
 
@@ -0,0 +1,38 @@
+"""
+Builds static JSON snapshots of terms, subjects and courses.
+Usage: python manage.py snapshot [<term code> ...] [--force]
+
+Snapshots the courses of the given terms, or of every term if none are given,
+into SNAPSHOTS_STORAGE. Terms that haven't changed since their last snapshot
+are skipped, unless --force is given. The worker does this after each import,
+so this is only needed to build snapshots by hand.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Term
+from api.snapshots import build_snapshots
+from api.views import CourseViewSet
+
+
+class Command(BaseCommand):
+    help = 'Builds static JSON snapshots of terms, subjects and courses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', type=int,
+                            help='codes of the terms to snapshot')
+        parser.add_argument('--force', action='store_true',
+                            help='rebuild snapshots even if unchanged')
+
+    def handle(self, *args, **options):
+        terms = None
+        if options['terms']:
+            terms = list(Term.objects.filter(code__in=options['terms']))
+            missing = set(options['terms']) - set(t.code for t in terms)
+            if missing:
+                raise CommandError('terms %s do not exist' % ', '.join(
+                    str(code) for code in sorted(missing)))
+
+        written = build_snapshots(CourseViewSet.queryset, terms,
+                                  options['force'])
+        self.stdout.write('snapshotted %s' % (', '.join(
+            str(t.code) for t in written) or 'nothing, all unchanged'))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 07:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_store_scrape_status_in_course'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='feed_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
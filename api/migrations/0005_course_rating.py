@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 07:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_course_feed_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE api_course SET rating = ROUND(COALESCE("
+            "    (SELECT AVG(response_avg) FROM api_evaluation"
+            "     WHERE course_id = api_course.id"
+            "     AND LOWER(question_text) LIKE '%overall%'),"
+            "    (SELECT AVG(response_avg) FROM api_evaluation"
+            "     WHERE course_id = api_course.id)"
+            "), 2)",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 07:59
+from __future__ import unicode_literals
+
+import re
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+# Frozen copies of api.models.QUESTION_PATTERNS and api.tasks.aggregate_evals
+# as of this migration, so that later changes to them don't change it
+QUESTION_PATTERNS = (
+    ('overall', re.compile(r'overall|^quality of (?:the )?course$', re.I)),
+    ('lectures', re.compile(r'lecture', re.I)),
+    ('precepts', re.compile(r'precept', re.I)),
+    ('labs', re.compile(r'\blab', re.I)),
+    ('classes', re.compile(r'class|seminar', re.I)),
+    ('readings', re.compile(r'reading', re.I)),
+    ('written', re.compile(r'written|paper|problem set|assignment', re.I)),
+    ('feedback', re.compile(r'feedback', re.I)),
+)
+
+
+def canonical_question(question_text):
+    for question, pattern in QUESTION_PATTERNS:
+        if pattern.search(question_text):
+            return question
+    return 'other'
+
+
+def aggregate_evals(stats):
+    groups = {}
+    for question_text, response in stats.items():
+        groups.setdefault(canonical_question(question_text), []).append(
+            response)
+    if stats:
+        groups['mean'] = list(stats.values())
+    return {question: (round(sum(responses) / len(responses), 2),
+                       len(responses))
+            for question, responses in groups.items()}
+
+
+# Rates each course by its overall quality aggregate, or else by its mean
+RATE_COURSES_SQL = """
+UPDATE api_course SET rating = coalesce((
+    SELECT a.response_avg FROM api_evaluationaggregate a
+    WHERE a.course_id = api_course.id AND a.question = 'overall'
+), (
+    SELECT a.response_avg FROM api_evaluationaggregate a
+    WHERE a.course_id = api_course.id AND a.question = 'mean'
+))
+"""
+
+
+def aggregate_evaluations(apps, schema_editor):
+    """Aggregates the evaluations of every course imported so far."""
+    Evaluation = apps.get_model('api', 'Evaluation')
+    EvaluationAggregate = apps.get_model('api', 'EvaluationAggregate')
+
+    stats = {}
+    evaluations = Evaluation.objects.values_list(
+        'course', 'course__term', 'question_text', 'response_avg')
+    for course, term, question_text, response in evaluations:
+        stats.setdefault((course, term), {})[question_text] = float(response)
+
+    aggregates = []
+    for (course, term), course_stats in stats.items():
+        for question, (avg, count) in aggregate_evals(course_stats).items():
+            aggregates.append(EvaluationAggregate(
+                course_id=course,
+                term_id=term,
+                question=question,
+                response_avg=avg,
+                response_count=count,
+            ))
+    EvaluationAggregate.objects.bulk_create(aggregates, batch_size=1000)
+    schema_editor.execute(RATE_COURSES_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_course_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvaluationAggregate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('question', models.CharField(choices=[('overall', 'Overall quality of the course'), ('lectures', 'Quality of lectures'), ('precepts', 'Quality of precepts'), ('labs', 'Quality of labs'), ('classes', 'Quality of classes'), ('readings', 'Quality of readings'), ('written', 'Quality of written assignments'), ('feedback', 'Quality of feedback'), ('other', 'Other questions'), ('mean', 'Mean of all questions')], max_length=10)),
+                ('response_avg', models.DecimalField(decimal_places=2, max_digits=3, validators=[django.core.validators.MaxValueValidator(5.0), django.core.validators.MinValueValidator(0.0)])),
+                ('response_count', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='course',
+            index_together=set([('term', 'rating')]),
+        ),
+        migrations.AddField(
+            model_name='evaluationaggregate',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='evaluation_aggregates', to='api.Course'),
+        ),
+        migrations.AddField(
+            model_name='evaluationaggregate',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Term'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='evaluationaggregate',
+            unique_together=set([('course', 'question')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='evaluationaggregate',
+            index_together=set([('term', 'question', 'response_avg')]),
+        ),
+        migrations.RunPython(aggregate_evaluations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 08:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_evaluationaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='numbers',
+            field=models.ManyToManyField(related_name='courses', to='api.CourseNumber'),
+        ),
+        # Every course keeps its primary number, but only the latest
+        # offering of a cross-listed number is known
+        migrations.RunSQL(
+            "INSERT INTO api_course_numbers (course_id, coursenumber_id)"
+            "    SELECT id, primary_number_id FROM api_course"
+            "    UNION"
+            "    SELECT course_id, id FROM api_coursenumber"
+            "    WHERE course_id IS NOT NULL",
+            migrations.RunSQL.noop,
+        ),
+    ]
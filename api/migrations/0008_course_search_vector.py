@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 08:02
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_course_numbers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # Django 1.10 can't declare GIN indexes on models
+        migrations.RunSQL(
+            "CREATE INDEX api_course_search_vector_gin"
+            "    ON api_course USING gin (search_vector)",
+            "DROP INDEX api_course_search_vector_gin",
+        ),
+        # Same as api.search.UPDATE_SEARCH_VECTORS_SQL at the time
+        migrations.RunSQL(
+            """
+            UPDATE api_course SET search_vector =
+                setweight(to_tsvector('english', api_course.title), 'A') ||
+                setweight(to_tsvector('english', coalesce((
+                    SELECT string_agg(s.code || ' ' || n.number || ' ' ||
+                                      s.code || n.number, ' ')
+                    FROM api_course_numbers cn
+                    JOIN api_coursenumber n ON n.id = cn.coursenumber_id
+                    JOIN api_subject s ON s.id = n.subject_id
+                    WHERE cn.course_id = api_course.id
+                ), '')), 'A') ||
+                setweight(to_tsvector('english', coalesce((
+                    SELECT string_agg(i.first_name || ' ' || i.last_name, ' ')
+                    FROM api_course_instructors ci
+                    JOIN api_instructor i ON i.id = ci.instructor_id
+                    WHERE ci.course_id = api_course.id
+                ), '')), 'B') ||
+                setweight(to_tsvector('english', api_course.description),
+                          'C') ||
+                setweight(to_tsvector('english', api_course.additional_info),
+                          'D')
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
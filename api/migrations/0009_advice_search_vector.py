@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 08:03
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_course_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='advice',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            "UPDATE api_advice SET search_vector = to_tsvector('english', text)",
+            migrations.RunSQL.noop,
+        ),
+        # Django 1.10 can't declare GIN indexes on models
+        migrations.RunSQL(
+            "CREATE INDEX api_advice_search_vector_gin"
+            "    ON api_advice USING gin (search_vector)",
+            "DROP INDEX api_advice_search_vector_gin",
+        ),
+    ]
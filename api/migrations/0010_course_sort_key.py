@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 08:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_advice_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='sort_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=40),
+            preserve_default=False,
+        ),
+        migrations.AlterIndexTogether(
+            name='course',
+            index_together=set([('term', 'rating'), ('term', 'sort_key')]),
+        ),
+        # Same as api.models.course_sort_key
+        migrations.RunSQL(
+            "UPDATE api_course SET sort_key ="
+            "    lpad(t.code::text, 4, '0') || ' ' || rpad(s.code, 3) || ' ' ||"
+            "    lpad(n.digits, greatest(length(n.digits), 4), '0') ||"
+            "    n.suffix || ' ' || api_course.course_id"
+            " FROM api_term t, api_subject s, ("
+            "    SELECT id, subject_id,"
+            "        substring(number from '^[0-9]*') AS digits,"
+            "        substring(number from '^[0-9]*(.*)$') AS suffix"
+            "    FROM api_coursenumber"
+            " ) n"
+            " WHERE t.id = api_course.term_id"
+            " AND n.id = api_course.primary_number_id"
+            " AND s.id = n.subject_id",
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_course_sort_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='section',
+            name='occupancy',
+            field=models.BinaryField(default=b''),
+        ),
+        # The days of existing meetings weren't stored, so their occupancy
+        # can't be computed here. Clearing the feed hashes makes the next
+        # import rewrite every course, computing it from the feed instead.
+        migrations.RunSQL("UPDATE api_course SET feed_hash = ''",
+                          migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 10:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_section_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meeting',
+            name='day_mask',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='end_minute',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='start_minute',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+            preserve_default=False,
+        ),
+        # Same as api.models.Meeting.update_indexed_times
+        migrations.RunSQL(
+            "UPDATE api_meeting SET"
+            "    day_mask ="
+            "        (CASE WHEN days LIKE 'M%' THEN 1 ELSE 0 END) +"
+            "        (CASE WHEN days ~ 'T(?!h)' THEN 2 ELSE 0 END) +"
+            "        (CASE WHEN days LIKE '%W%' THEN 4 ELSE 0 END) +"
+            "        (CASE WHEN days LIKE '%Th%' THEN 8 ELSE 0 END) +"
+            "        (CASE WHEN days LIKE '%F%' THEN 16 ELSE 0 END),"
+            "    start_minute = extract(hour FROM start_time) * 60 +"
+            "        extract(minute FROM start_time),"
+            "    end_minute = extract(hour FROM end_time) * 60 +"
+            "        extract(minute FROM end_time)",
+            migrations.RunSQL.noop,
+        ),
+        # Meetings without stored days get a day_mask of 0 above, so as in
+        # 0011, the next import is made to rewrite every course
+        migrations.RunSQL("UPDATE api_course SET feed_hash = ''",
+                          migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 11:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_meeting_indexed_times'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('class_id', models.CharField(max_length=15)),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('enrollment', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveSmallIntegerField()),
+                ('status', models.CharField(choices=[('Open', 'Open'), ('Closed', 'Closed'), ('Cancelled', 'Cancelled')], max_length=10)),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Term')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='enrollmentsnapshot',
+            index_together=set([('term', 'class_id', 'time')]),
+        ),
+    ]
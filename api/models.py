@@ -13,12 +13,15 @@ import re
 import uuid
 from django.utils.timezone import now
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import RegexValidator
 from django.core.validators import MaxValueValidator
 from django.core.validators import MinValueValidator
 from extended_choices import Choices
 
+from .schedules import day_mask, minutes, parse_days
+
 
 class UUIDModel(models.Model):
 
@@ -186,6 +189,17 @@ class Instructor(UUIDModel):
         return u"%s %s" % (self.first_name, self.last_name)
 
 
+def course_sort_key(term_code, subject_code, number, course_id):
+    """
+    Returns the key that courses are listed by: by term, then primary
+    subject, then number, with the course id to keep keys unique. Numbers are
+    padded so that they sort numerically, ex. 99 before 201C before 226.
+    """
+    digits, suffix = re.match(r'(\d*)(.*)', number).groups()
+    return '%04d %-3s %04d%s %s' % (int(term_code), subject_code,
+                                    int(digits or 0), suffix, course_id)
+
+
 class Course(UUIDModel):
 
     """
@@ -234,21 +248,72 @@ class Course(UUIDModel):
         blank=True,
     )
 
+    # Every number the course is listed under in its term, including the
+    # primary number. Unlike CourseNumber.course, these links are kept for
+    # every term, so they trace the lineage of a course across terms.
+    numbers = models.ManyToManyField(CourseNumber,
+                                     related_name='courses')
+
     instructors = models.ManyToManyField(Instructor,
                                          related_name='courses')
 
     description = models.TextField(blank=True)
     additional_info = models.TextField(blank=True)
 
+    # Overall rating from the course evaluations, if any
+    rating = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        null=True,
+        blank=True,
+    )
+
+    # Maintained by api.search, and indexed with GIN
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    # Denormalized from the term and primary number, so that listings can be
+    # paginated by an index. See course_sort_key.
+    sort_key = models.CharField(
+        max_length=40,
+        db_index=True,
+        editable=False,
+    )
+
     last_updated = models.DateTimeField(default=now)
+    # SHA-1 of the web feeds data this course was last imported from
+    feed_hash = models.CharField(
+        max_length=40,
+        blank=True,
+        editable=False,
+    )
     details_scraped = models.BooleanField(default=False)
     evals_scraped = models.BooleanField(default=False)
 
     def __unicode__(self):
         return u'%s (%s)' % (self.title, self.term)
 
+    def offerings(self):
+        """
+        Returns every offering of this course across terms, including this
+        one: the courses sharing its course id or any of its numbers.
+        """
+        Link = Course.numbers.through
+        numbers = Link.objects.filter(course=self).values('coursenumber')
+        return Course.objects.filter(
+            models.Q(course_id=self.course_id) |
+            models.Q(pk__in=Link.objects.filter(
+                coursenumber__in=numbers).values('course'))
+        )
+
     class Meta:
         unique_together = ('course_id', 'term')
+        index_together = [
+            ('term', 'rating'),
+            ('term', 'sort_key'),
+        ]
 
 
 class Section(UUIDModel):
@@ -307,6 +372,12 @@ class Section(UUIDModel):
     enrollment = models.PositiveSmallIntegerField()
     capacity = models.PositiveSmallIntegerField()
 
+    # Bitmask of the five-minute slots of the week the section's meetings
+    # take up, see api.schedules
+    occupancy = models.BinaryField(
+        default=b'',
+    )
+
     def __unicode__(self):
         return self.name.decode('utf-8')
 
@@ -341,6 +412,22 @@ class Meeting(UUIDModel):
         )],
     )
 
+    # The days and times again, in a form that can be filtered by index:
+    # a bitmask of the days, see api.schedules.day_mask, and the start and
+    # end times in minutes since midnight
+    day_mask = models.PositiveSmallIntegerField(
+        db_index=True,
+        editable=False,
+    )
+    start_minute = models.PositiveSmallIntegerField(
+        db_index=True,
+        editable=False,
+    )
+    end_minute = models.PositiveSmallIntegerField(
+        db_index=True,
+        editable=False,
+    )
+
     # Meeting Location
     # Format should be [Building] [Room #]
     location = models.CharField(
@@ -348,6 +435,17 @@ class Meeting(UUIDModel):
         blank=True,
     )
 
+    def update_indexed_times(self):
+        """Sets the day mask and minutes from the days and times."""
+        self.day_mask = day_mask(parse_days(self.days))
+        self.start_minute = minutes(self.start_time)
+        self.end_minute = minutes(self.end_time)
+
+    # Automatically update the indexed days and times upon save
+    def save(self, *args, **kwargs):
+        self.update_indexed_times()
+        super(Meeting, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return u'%s %s %s at %s' % (self.days, self.start_time,
                                     self.end_time, self.location)
@@ -381,6 +479,131 @@ class Evaluation(UUIDModel):
         return u'%s: %.2f' % (self.question_text, self.response_avg)
 
 
+#: Patterns used to recognize evaluation questions, in order of precedence.
+#: The wording of questions varies between terms, so we match loosely.
+QUESTION_PATTERNS = (
+    ('overall', re.compile(r'overall|^quality of (?:the )?course$', re.I)),
+    ('lectures', re.compile(r'lecture', re.I)),
+    ('precepts', re.compile(r'precept', re.I)),
+    ('labs', re.compile(r'\blab', re.I)),
+    ('classes', re.compile(r'class|seminar', re.I)),
+    ('readings', re.compile(r'reading', re.I)),
+    ('written', re.compile(r'written|paper|problem set|assignment', re.I)),
+    ('feedback', re.compile(r'feedback', re.I)),
+)
+
+
+def canonical_question(question_text):
+    """
+    Returns the EvaluationAggregate.QUESTIONS value that the given evaluation
+    question is asking about, or 'other' if it's unrecognized.
+    """
+    for question, pattern in QUESTION_PATTERNS:
+        if pattern.search(question_text):
+            return question
+    return 'other'
+
+
+class EvaluationAggregate(UUIDModel):
+
+    """
+    Represents the evaluation responses of a course offering aggregated by
+    canonical question, so that courses can be compared without pivoting the
+    free-text questions of every evaluation. Refreshed whenever the course's
+    evaluations are imported.
+    """
+
+    course = models.ForeignKey(
+        Course,
+        on_delete=models.CASCADE,
+        related_name='evaluation_aggregates',
+    )
+
+    # Denormalized from the course, so that the courses in a term can be
+    # ranked using an index
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    QUESTIONS = Choices(
+        ('OVERALL', 'overall', 'Overall quality of the course'),
+        ('LECTURES', 'lectures', 'Quality of lectures'),
+        ('PRECEPTS', 'precepts', 'Quality of precepts'),
+        ('LABS', 'labs', 'Quality of labs'),
+        ('CLASSES', 'classes', 'Quality of classes'),
+        ('READINGS', 'readings', 'Quality of readings'),
+        ('WRITTEN', 'written', 'Quality of written assignments'),
+        ('FEEDBACK', 'feedback', 'Quality of feedback'),
+        ('OTHER', 'other', 'Other questions'),
+        ('MEAN', 'mean', 'Mean of all questions'),
+    )
+    question = models.CharField(
+        max_length=10,
+        choices=QUESTIONS,
+    )
+
+    response_avg = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        validators=[
+            MaxValueValidator(5.0),
+            MinValueValidator(0.0),
+        ],
+    )
+    # Number of evaluation questions aggregated
+    response_count = models.PositiveSmallIntegerField()
+
+    def __unicode__(self):
+        return u'%s: %.2f' % (self.question, self.response_avg)
+
+    class Meta:
+        unique_together = ('course', 'question')
+        index_together = [
+            ('term', 'question', 'response_avg'),
+        ]
+
+
+class EnrollmentSnapshot(UUIDModel):
+
+    """
+    Records the enrollment of a section at a point in time. Snapshots are
+    only taken when a section's numbers change, and are kept by term and
+    class id rather than by section, since sections are recreated whenever
+    their course is reimported. Past the retention window, only the last
+    snapshot of each day is kept.
+    """
+
+    term = models.ForeignKey(
+        Term,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    class_id = models.CharField(
+        max_length=15,
+    )
+    time = models.DateTimeField(
+        default=now,
+    )
+
+    enrollment = models.PositiveSmallIntegerField()
+    capacity = models.PositiveSmallIntegerField()
+    status = models.CharField(
+        max_length=10,
+        choices=Section.STATUSES,
+    )
+
+    class Meta:
+        index_together = [
+            ('term', 'class_id', 'time'),
+        ]
+
+    def __unicode__(self):
+        return u'%s at %s: %d/%d' % (self.class_id, self.time,
+                                     self.enrollment, self.capacity)
+
+
 class Advice(UUIDModel):
 
     """
@@ -395,6 +618,12 @@ class Advice(UUIDModel):
     )
     text = models.TextField()
 
+    # Maintained by api.search, and indexed with GIN
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
 
 class User(UUIDModel):
 
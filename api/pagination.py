@@ -0,0 +1,47 @@
+"""
+Pagination for the easyPCE API.
+"""
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class CoursePagination(CursorPagination):
+
+    """
+    Pages through courses by cursor rather than by offset, so that deep pages
+    are as fast as the first. The page size can be given by ?limit=, and the
+    total count, which takes a query of its own, left out by ?count=false.
+    """
+
+    ordering = 'sort_key'
+    page_size_query_param = 'limit'
+    max_page_size = 500
+    count_query_param = 'count'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) != 'false':
+            self.count = queryset.count()
+        return super(CoursePagination, self).paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        fields = [
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+        return Response(OrderedDict(fields))
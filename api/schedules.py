@@ -0,0 +1,211 @@
+"""
+Weekly occupancy of sections, for checking schedules for conflicts and
+generating the schedules that have none. The week
+is cut into five days of 288 five-minute slots, and a section's occupancy is
+a bitmask of the slots any of its meetings overlap, stored as bytes on the
+section. Two sections conflict exactly when their masks share a bit, so
+checking a schedule against thousands of sections takes one AND each.
+"""
+from __future__ import absolute_import, unicode_literals
+from collections import defaultdict
+import binascii
+import datetime
+import json
+import re
+
+#: Codes of the days of the week classes meet on, in order
+DAYS = ('M', 'T', 'W', 'Th', 'F')
+
+#: Length of a slot, in minutes
+SLOT_MINUTES = 5
+
+#: Number of slots in a day
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+#: Number of bytes an occupancy mask is stored in
+MASK_BYTES = len(DAYS) * SLOTS_PER_DAY // 8
+
+DAYS_REGEX = re.compile(r'Th|M|T|W|F')
+TIME_FORMATS = ('%I:%M %p', '%H:%M:%S', '%H:%M')
+
+
+def parse_time(text):
+    """Parses a time like 03:00 PM, as given by the registrar."""
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text.strip(), time_format).time()
+        except ValueError:
+            pass
+    raise ValueError('invalid time: %r' % text)
+
+
+def days_string(days):
+    """
+    Returns the given days in the order and format Meeting.days stores them
+    in, such as MWF or TTh.
+    """
+    return ''.join(day for day in DAYS if day in days)
+
+
+def parse_days(text):
+    """Returns the list of days in a Meeting.days string."""
+    return DAYS_REGEX.findall(text)
+
+
+def day_mask(days):
+    """Returns the given days as a bitmask, one bit per day of DAYS."""
+    mask = 0
+    for day in days:
+        mask |= 1 << DAYS.index(day)
+    return mask
+
+
+def masks_meeting_on(days):
+    """Returns every day mask that includes any of the given days."""
+    days = day_mask(days)
+    return [mask for mask in range(1 << len(DAYS)) if mask & days]
+
+
+def minutes(time):
+    """Returns the number of minutes since midnight of the given time."""
+    return time.hour * 60 + time.minute
+
+
+def meeting_mask(days, start_time, end_time):
+    """
+    Returns the occupancy of a meeting on the given days, from start_time to
+    end_time, as an int. A slot is occupied if the meeting overlaps any of it.
+    """
+    first = minutes(start_time) // SLOT_MINUTES
+    last = -(-minutes(end_time) // SLOT_MINUTES)  # rounded up
+    if last <= first:
+        return 0
+    day_mask = (1 << (last - first)) - 1
+
+    mask = 0
+    for day in days:
+        mask |= day_mask << (DAYS.index(day) * SLOTS_PER_DAY + first)
+    return mask
+
+
+def section_mask(meetings):
+    """
+    Returns the occupancy of a section with the given meetings, each of
+    which has days, start_time and end_time like a Meeting.
+    """
+    mask = 0
+    for meeting in meetings:
+        mask |= meeting_mask(parse_days(meeting.days), meeting.start_time,
+                             meeting.end_time)
+    return mask
+
+
+def encode_mask(mask):
+    return binascii.unhexlify('%0*x' % (MASK_BYTES * 2, mask))
+
+
+def decode_mask(data):
+    if not data:
+        return 0
+    return int(binascii.hexlify(bytes(data)), 16)
+
+
+def conflicting_courses(sections, chosen):
+    """
+    Given (course pk, section type, occupancy) for every section in a term,
+    returns the set of the pks of courses that can't be taken alongside the
+    chosen occupancy mask: those with a section type every section of which
+    overlaps it.
+    """
+    fits = defaultdict(dict)
+    for course, section_type, occupancy in sections:
+        types = fits[course]
+        if not types.get(section_type):
+            types[section_type] = not decode_mask(occupancy) & chosen
+    return set(course for course, types in fits.items()
+               if not all(types.values()))
+
+
+def section_options(sections):
+    """
+    Given (course id, section type, class id, occupancy) for every section of
+    the courses to schedule, returns the choices to make: for each course and
+    section type, a list of (occupancy, class ids) pairs. Sections that meet
+    at the same times are interchangeable, so each is one choice between them.
+    """
+    options = defaultdict(lambda: defaultdict(list))
+    for course, section_type, class_id, occupancy in sections:
+        options[course, section_type][decode_mask(occupancy)].append(class_id)
+    return {
+        key: sorted((mask, sorted(class_ids))
+                    for mask, class_ids in by_mask.items())
+        for key, by_mask in options.items()
+    }
+
+
+class ScheduleGenerator(object):
+
+    """
+    Enumerates the conflict-free schedules that take one choice of section
+    for each course and section type, by backtracking. The choice with the
+    fewest sections left that fit is always made next, so dead ends are found
+    early, and the search gives up after max_steps choices have been tried,
+    setting truncated, so a single request can't take unbounded time.
+    """
+
+    def __init__(self, options, max_steps):
+        self.options = options
+        self.max_steps = max_steps
+        self.steps = 0
+        self.truncated = False
+
+    def __iter__(self):
+        return self.search(0, frozenset(self.options), [])
+
+    def search(self, mask, remaining, chosen):
+        if not remaining:
+            yield sorted(chosen)
+            return
+
+        # Pick the most constrained choice left, giving up if one can't fit
+        best_key, best_fits = None, None
+        for key in sorted(remaining):
+            fits = [option for option in self.options[key]
+                    if not option[0] & mask]
+            if not fits:
+                return
+            if best_fits is None or len(fits) < len(best_fits):
+                best_key, best_fits = key, fits
+
+        for occupancy, class_ids in best_fits:
+            self.steps += 1
+            if self.steps > self.max_steps:
+                self.truncated = True
+                return
+
+            chosen.append((best_key, class_ids))
+            for schedule in self.search(mask | occupancy,
+                                        remaining - {best_key}, chosen):
+                yield schedule
+            chosen.pop()
+            if self.truncated:
+                return
+
+    def stream(self, limit):
+        """
+        Yields up to limit schedules as lines of JSON, each listing the class
+        ids to choose between for each course and section type, followed by
+        a line with the count of schedules and whether there were more.
+        """
+        count = 0
+        for schedule in self:
+            if count == limit:
+                self.truncated = True
+                break
+            count += 1
+            yield json.dumps({'sections': [
+                {'course_id': course, 'type': section_type,
+                 'class_ids': class_ids}
+                for (course, section_type), class_ids in schedule
+            ]}) + '\n'
+        yield json.dumps({'count': count, 'truncated': self.truncated}) + '\n'
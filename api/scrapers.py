@@ -1,11 +1,23 @@
 """
 The functions needed to actually scrape the Princeton registrar.
 """
-from bs4 import BeautifulSoup
-import urllib
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+from django.conf import settings
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+import requests
 import json
 import base64
+import logging
+import os
 import re
+import time
+
+from .httpcache import ResponseCache
+
+logger = logging.getLogger(__name__)
 
 #: URL for course offerings feed, per
 #: https://webfeeds.princeton.edu/#feed,19
@@ -17,32 +29,162 @@ FEED_OPTS = {
     'fmt': 'json'  # output JSON instead of XML
 }
 
+#: Statuses that are worth retrying, since they're usually transient
+RETRY_STATUSES = (500, 502, 503, 504)
+
+#: Seconds that a cached feed response is used without revalidating it
+FEED_CACHE_TTL = 60 * 60
+
+# The session is created lazily, and recreated after a fork since worker
+# processes can't share sockets.
+_session = None
+_session_pid = None
+
+_cache = None
+
+
+def get_session():
+    """
+    Returns the HTTP session shared by all scrapers in this process. The
+    session keeps connections to each host alive between requests, and
+    allows at most SCRAPER_MAX_CONNECTIONS_PER_HOST concurrent requests to
+    any one host.
+    """
+    global _session, _session_pid
+
+    if _session is None or _session_pid != os.getpid():
+        adapter = HTTPAdapter(
+            pool_maxsize=settings.SCRAPER_MAX_CONNECTIONS_PER_HOST,
+            pool_block=True,  # wait for a free connection instead of opening
+            max_retries=Retry(
+                total=settings.SCRAPER_RETRIES,
+                backoff_factor=0.5,
+                status_forcelist=RETRY_STATUSES,
+            ),
+        )
+
+        _session = requests.Session()
+        _session.headers['Accept-Encoding'] = 'gzip, deflate'
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+        _session_pid = os.getpid()
+
+    return _session
+
+
+def get_cache():
+    """
+    Returns the response cache shared by all scrapers in this process, or
+    None if SCRAPER_CACHE_DIR isn't set.
+    """
+    global _cache
+
+    if _cache is None and settings.SCRAPER_CACHE_DIR:
+        _cache = ResponseCache(settings.SCRAPER_CACHE_DIR,
+                               settings.SCRAPER_CACHE_MAX_SIZE)
+    return _cache
+
 
-def get_json(params):
+def fetch(url, params, ttl=0):
     """
-    Returns the course listing page for the given params.
+    Requests the given url with the given query params using the shared
+    session, and returns the response body. Raises requests.HTTPError if the
+    server responds with an error.
+
+    Responses are cached on disk if a cache is configured. Cached responses
+    younger than ttl seconds (or any age, if ttl is None) are returned without
+    contacting the server, and older ones are revalidated with a conditional
+    request.
+    """
+    cache = get_cache()
+    entry = cache.get(url, params) if cache else None
+    if entry is not None and entry.is_fresh(ttl):
+        return entry.content
+
+    headers = entry.conditional_headers() if entry else {}
+    response = get_session().get(url, params=params, headers=headers,
+                                 timeout=(settings.SCRAPER_CONNECT_TIMEOUT,
+                                          settings.SCRAPER_READ_TIMEOUT))
+
+    if entry is not None and response.status_code == 304:
+        cache.touch(url, params, entry)
+        return entry.content
+
+    response.raise_for_status()
+    if cache:
+        cache.set(url, params, response.content, response.headers)
+    return response.content
+
+
+def get_json(params, ttl=FEED_CACHE_TTL):
+    """
+    Returns the course listing page for the given params, from the cache if
+    it was fetched less than ttl seconds ago.
     """
     feed_opts = FEED_OPTS.copy()
     feed_opts.update(params)
 
-    feed_opts_enc = urllib.urlencode(feed_opts)
-    request_url = FEED_URL + '?' + feed_opts_enc
+    return json.loads(fetch(FEED_URL, feed_opts, ttl))
 
-    request = urllib.urlopen(request_url)
-    return json.load(request)
 
-
-def get_soup(base_url, params):
+def parse_page(page, extract, parse_only=None):
     """
-    Returns a Beautiful Soup instance for the given url and options
-    Be warned that a page existing is not a guarantee that the course
-    existed in that term.
+    Parses the given page with the fast SCRAPER_PARSER, keeping only the
+    elements matched by the parse_only SoupStrainer, and returns the result of
+    calling extract on the soup. If the parser isn't available or extract
+    fails on its output, the whole page is parsed again with the slower but
+    more lenient html5lib instead.
     """
-    url_opts_enc = urllib.urlencode(params)
-    request_url = base_url + '?' + url_opts_enc
+    parser = settings.SCRAPER_PARSER
+    if parser == 'html5lib':  # doesn't support parse_only
+        parse_only = None
+
+    try:
+        soup = BeautifulSoup(page, parser, parse_only=parse_only)
+        return extract(soup)
+    except (FeatureNotFound, AttributeError, IndexError, KeyError,
+            TypeError, ValueError) as e:
+        logger.info('falling back to html5lib after %r' % e)
 
-    page = urllib.urlopen(request_url)
-    return BeautifulSoup(page, 'html5lib')
+    return extract(BeautifulSoup(page, 'html5lib'))
+
+
+def scrape_many(jobs, timeout=None):
+    """
+    Runs each of the given (scraper, args) jobs on a pool of
+    SCRAPER_CONCURRENCY threads, and yields ((scraper, args), result, error)
+    tuples in the order they finish. Exceptions raised by a scraper are
+    returned as the error, so that one bad page doesn't stop the rest.
+    Concurrency per host is still bounded by the shared session.
+
+    If a timeout is given, stops after that many seconds, abandoning the jobs
+    that haven't finished, so that a stuck host can't hang the caller.
+    """
+    def run(job):
+        scraper, args = job
+        try:
+            return job, scraper(*args), None
+        except Exception as e:
+            return job, None, e
+
+    deadline = time.time() + timeout if timeout is not None else None
+    pool = ThreadPool(settings.SCRAPER_CONCURRENCY)
+    try:
+        results = pool.imap_unordered(run, jobs)
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.time(), 0)
+            try:
+                result = results.next(remaining)
+            except StopIteration:
+                return
+            except TimeoutError:
+                logger.warning('gave up on scraping after %ss' % timeout)
+                return
+            yield result
+    finally:
+        pool.terminate()
 
 
 #####################################################################
@@ -112,16 +254,18 @@ def scrape_subjects(term='all'):
     return subjects
 
 
-def scrape_courses(term='current', subject='all'):
+def scrape_courses(term='current', subject='all', ttl=FEED_CACHE_TTL):
     """
     Returns an generator of all courses found for the given
     term. To understand the formatting used, examine sample data
     from https://webfeeds.princeton.edu/#feed,19
+
+    Pass a ttl of 0 to always revalidate a cached feed with the server.
     """
     data = get_json({
         'term': str(term),
         'subject': str(subject),
-    })
+    }, ttl)
 
     term_name = data['term'][0]['reg_name']
     term_code = data['term'][0]['code']
@@ -149,6 +293,9 @@ def scrape_courses(term='current', subject='all'):
 REGISTRAR_BASE_URL = 'https://registrar.princeton.edu/course-offerings/' \
            'course_details.xml'
 
+#: Seconds that a cached course details page is used without revalidating it
+REGISTRAR_CACHE_TTL = 24 * 60 * 60
+
 #: Root ID for description section
 DESCRIPTION_ID = 'timetable'
 
@@ -158,6 +305,10 @@ ADDL_INFO_START_ID = 'descr'
 #: Ending node text
 ADDL_INFO_END_CONTENTS = re.compile('Schedule/Classroom assignment:')
 
+#: Everything we need from the course details page is within the description
+#: section, so there's no need to build a tree for the rest of it.
+DETAILS_STRAINER = SoupStrainer(id=DESCRIPTION_ID)
+
 
 def scrape_course_details(term, course_id):
     """
@@ -165,6 +316,19 @@ def scrape_course_details(term, course_id):
     following the format of the JSON from the web feeds.
     https://webfeeds.princeton.edu/#feed,19
     """
+    page = fetch(REGISTRAR_BASE_URL, {
+        'term': term,
+        'courseid': course_id,
+    }, REGISTRAR_CACHE_TTL)
+
+    return parse_course_details(page)
+
+
+def parse_course_details(page):
+    """
+    Returns a dict of relevant information from the given course details
+    page. See scrape_course_details.
+    """
 
     def get_course_addl_info(soup):
         """
@@ -289,28 +453,27 @@ def scrape_course_details(term, course_id):
         match = re.match(r'^\(([A-Z]{2,3})\)$', dist_req.strip())
         return match.groups()[0] if match else None
 
-    #: Regexp used to identify professor ID
-    PROFESSOR_ID_REGEX = re.compile(r'<a href="/course-offerings/'
-                                    r'dirinfo\.xml\?uid=(\d+)"')
+    #: Regexp used to identify professor ID in directory links
+    PROFESSOR_HREF_REGEX = re.compile(r'^/course-offerings/'
+                                      r'dirinfo\.xml\?uid=(\d+)$')
 
     def get_instructors(soup):
         """
         Returns the ID of the instructors of the course.
         """
-        return PROFESSOR_ID_REGEX.findall(str(soup))
+        links = soup.find_all('a', href=PROFESSOR_HREF_REGEX)
+        return [PROFESSOR_HREF_REGEX.match(a['href']).group(1) for a in links]
 
-    soup = get_soup(REGISTRAR_BASE_URL, {
-        'term': term,
-        'courseid': course_id,
-    })
+    def extract(soup):
+        return {
+            'additional_info': get_course_addl_info(soup),
+            'classes': get_course_classes(soup),
+            'enroll_params': get_course_enroll_params(soup),
+            'dist_req': get_distribution_requirement(soup),
+            'instructors': get_instructors(soup),
+        }
 
-    return {
-        'additional_info': get_course_addl_info(soup),
-        'classes': get_course_classes(soup),
-        'enroll_params': get_course_enroll_params(soup),
-        'dist_req': get_distribution_requirement(soup),
-        'instructors': get_instructors(soup),
-    }
+    return parse_page(page, extract, DETAILS_STRAINER)
 
 
 #####################################################################
@@ -321,12 +484,50 @@ def scrape_course_details(term, course_id):
 #: Base URL for course evaluations page
 EVALUATION_BASE_URL = 'https://reg-captiva.princeton.edu/chart/index.php'
 
+#: Seconds that a cached evaluations page is used without revalidating it.
+#: Evaluations rarely change once published, and pages without any aren't
+#: cached at all.
+EVALUATION_CACHE_TTL = 30 * 24 * 60 * 60
+
+
+def is_eval_element(name, attrs):
+    """
+    Returns whether the given element is needed to scrape evaluations, namely
+    the stats chart and the tables, which include the comments.
+    """
+    return name == 'table' or attrs.get('id') == 'chart'
+
+
+#: Only build a tree for the elements needed from the evaluations page
+EVALS_STRAINER = SoupStrainer(is_eval_element)
+
 
 def scrape_evals(term, course_id):
     """
     Returns the course evaluation stats (as a dict) and comments
     (as an array of strings) for a given course and term.
     """
+    params = {
+        'terminfo': term,
+        'courseinfo': course_id,
+    }
+    page = fetch(EVALUATION_BASE_URL, params, EVALUATION_CACHE_TTL)
+    stats, comments = parse_evals(page)
+
+    # Evaluations of the current term are only published after it ends, so
+    # don't keep a page without any, or it would hide them once they are
+    cache = get_cache()
+    if not stats and cache:
+        cache.delete(EVALUATION_BASE_URL, params)
+
+    return stats, comments
+
+
+def parse_evals(page):
+    """
+    Returns the course evaluation stats and comments from the given course
+    evaluations page. See scrape_evals.
+    """
 
     def get_eval_stats(soup):
         """
@@ -364,12 +565,7 @@ def scrape_evals(term, course_id):
         comments = tables[-1].find_all('td')
         return [c.get_text().strip() for c in comments]
 
-    soup = get_soup(EVALUATION_BASE_URL, {
-        'terminfo': term,
-        'courseinfo': course_id,
-    })
-
-    stats = get_eval_stats(soup)
-    comments = get_eval_comments(soup)
+    def extract(soup):
+        return get_eval_stats(soup), get_eval_comments(soup)
 
-    return stats, comments
+    return parse_page(page, extract, EVALS_STRAINER)
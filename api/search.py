@@ -0,0 +1,159 @@
+"""
+Full-text search over courses and advice. Every course keeps a search vector
+built from its title, numbers, instructors, description and additional info,
+and every piece of advice one built from its text, which the import tasks
+refresh whenever any of those change.
+"""
+from __future__ import absolute_import, unicode_literals
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector)
+from django.db import connection
+import re
+from django.db.models import F, Func, TextField, Value
+
+from .models import Advice
+
+#: Text search configuration used for both the vectors and the queries
+SEARCH_CONFIG = 'english'
+
+#: Options for highlighting matches in advice snippets, see ts_headline
+HEADLINE_OPTIONS = ('StartSel=<mark>, StopSel=</mark>, '
+                    'MaxWords=35, MinWords=15, MaxFragments=2')
+
+#: Matches the words of search text
+WORD_REGEX = re.compile(r'\w+', re.UNICODE)
+
+# Built in SQL, since it draws from related tables and Django can't update a
+# column from a join. Numbers are included both as "COS 226" and "COS226".
+UPDATE_SEARCH_VECTORS_SQL = """
+UPDATE api_course SET search_vector =
+    setweight(to_tsvector(%(config)s, api_course.title), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(s.code || ' ' || n.number || ' ' ||
+                          s.code || n.number, ' ')
+        FROM api_course_numbers cn
+        JOIN api_coursenumber n ON n.id = cn.coursenumber_id
+        JOIN api_subject s ON s.id = n.subject_id
+        WHERE cn.course_id = api_course.id
+    ), '')), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(i.first_name || ' ' || i.last_name, ' ')
+        FROM api_course_instructors ci
+        JOIN api_instructor i ON i.id = ci.instructor_id
+        WHERE ci.course_id = api_course.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(%(config)s, api_course.description), 'C') ||
+    setweight(to_tsvector(%(config)s, api_course.additional_info), 'D')
+"""
+
+
+def update_search_vectors(courses=None):
+    """
+    Rebuilds the search vectors of the given courses in one query, or of
+    every course if none are given.
+    """
+    sql = UPDATE_SEARCH_VECTORS_SQL
+    params = {'config': SEARCH_CONFIG}
+    if courses is not None:
+        ids = [str(course.pk) for course in courses]
+        if not ids:
+            return
+        sql += 'WHERE api_course.id = ANY(%(ids)s::uuid[])'
+        params['ids'] = ids
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def search_courses(queryset, text):
+    """
+    Narrows the given queryset of courses to those matching the given search
+    text, best matches first.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).filter(
+        search_vector=query,
+    ).order_by('-rank', 'pk')
+
+
+class PrefixQuery(SearchQuery):
+
+    """
+    Matches documents containing words starting with every word of the
+    search text, within the given weights only. Since the search vectors are
+    indexed, this is fast enough to run on every keystroke.
+    """
+
+    def __init__(self, text, weights='', **extra):
+        words = WORD_REGEX.findall(text)
+        value = ' & '.join("'%s':*%s" % (word, weights) for word in words)
+        super(PrefixQuery, self).__init__(value, **extra)
+
+    def as_sql(self, compiler, connection):
+        config_sql, config_params = compiler.compile(self.config)
+        template = 'to_tsquery({}::regconfig, %s)'.format(config_sql)
+        return template, config_params + [self.value]
+
+
+def autocomplete_courses(queryset, text):
+    """
+    Narrows the given queryset of courses to those with a title, number or
+    instructor name starting with every word of the given text, best matches
+    first. Returns an empty queryset if the text has no words.
+    """
+    query = PrefixQuery(text, weights='AB', config=SEARCH_CONFIG)
+    if not query.value:
+        return queryset.none()
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).filter(
+        search_vector=query,
+    ).order_by('-rank', '-term__code', 'pk')
+
+
+def update_advice_vectors(courses):
+    """Rebuilds the search vectors of the advice of the given courses."""
+    Advice.objects.filter(course__in=courses).update(
+        search_vector=SearchVector('text', config=SEARCH_CONFIG),
+    )
+
+
+def escape_html(expression):
+    """Escapes the HTML special characters of a text expression."""
+    for char, entity in (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')):
+        expression = Func(expression, Value(char), Value(entity),
+                          function='replace')
+    return expression
+
+
+class Headline(Func):
+
+    """
+    Excerpts the fragments of a document that match a query, with the matches
+    highlighted. The document is escaped first, so that the result is safe
+    to use as HTML. Django 1.10 has no equivalent of ts_headline.
+    """
+
+    function = 'ts_headline'
+
+    def __init__(self, expression, query, options=HEADLINE_OPTIONS):
+        super(Headline, self).__init__(
+            Value(SEARCH_CONFIG), escape_html(expression), query,
+            Value(options), output_field=TextField(),
+        )
+
+
+def search_advice(queryset, text):
+    """
+    Narrows the given queryset of advice to those matching the given search
+    text, best matches first, along with a highlighted snippet of each.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+        snippet=Headline(F('text'), query),
+    ).filter(
+        search_vector=query,
+    ).order_by('-rank', 'pk')
@@ -96,6 +96,18 @@ class SectionSerializer(serializers.ModelSerializer):
         )
 
 
+class EnrollmentSnapshotSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.EnrollmentSnapshot
+        fields = (
+            'time',
+            'enrollment',
+            'capacity',
+            'status',
+        )
+
+
 class EvaluationSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -106,6 +118,17 @@ class EvaluationSerializer(serializers.ModelSerializer):
         )
 
 
+class EvaluationAggregateSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.EvaluationAggregate
+        fields = (
+            'question',
+            'response_avg',
+            'response_count',
+        )
+
+
 class AdviceSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -115,10 +138,80 @@ class AdviceSerializer(serializers.ModelSerializer):
         )
 
 
+class AdviceSearchSerializer(serializers.ModelSerializer):
+
+    """
+    Represents a piece of advice matching a search, as a snippet with the
+    matches highlighted, along with the course it's about.
+    """
+
+    course_id = serializers.CharField(source='course.course_id')
+    term = serializers.IntegerField(source='course.term.code')
+    primary_number = serializers.StringRelatedField(
+        source='course.primary_number')
+    snippet = serializers.CharField()
+
+    class Meta:
+        model = models.Advice
+        fields = (
+            'course_id',
+            'term',
+            'primary_number',
+            'snippet',
+        )
+
+
+class CourseListSerializer(serializers.ModelSerializer):
+
+    """
+    A compact representation of a course, for listings. Leaves out
+    descriptions and all nested relations.
+    """
+
+    primary_number = serializers.StringRelatedField()
+
+    class Meta:
+        model = models.Course
+        fields = (
+            'course_id',
+            'title',
+            'term',
+            'primary_number',
+            'dist_req',
+            'rating',
+        )
+
+
+class CourseHistorySerializer(serializers.ModelSerializer):
+
+    """
+    Represents one offering of a course in its history, along with the
+    aggregated evaluations of that offering.
+    """
+
+    term = serializers.SlugRelatedField(slug_field='code', read_only=True)
+    primary_number = serializers.StringRelatedField()
+    evaluation_aggregates = EvaluationAggregateSerializer(many=True,
+                                                          read_only=True)
+
+    class Meta:
+        model = models.Course
+        fields = (
+            'course_id',
+            'title',
+            'term',
+            'primary_number',
+            'rating',
+            'evaluation_aggregates',
+        )
+
+
 class CourseSerializer(serializers.ModelSerializer):
 
     sections = SectionSerializer(many=True, read_only=True)
     evaluations = EvaluationSerializer(many=True, read_only=True)
+    evaluation_aggregates = EvaluationAggregateSerializer(many=True,
+                                                          read_only=True)
     advice = AdviceSerializer(many=True, read_only=True)
 
     class Meta:
@@ -135,9 +228,11 @@ class CourseSerializer(serializers.ModelSerializer):
             'description',
             'additional_info',
             'instructors',
+            'rating',
             'last_updated',
             'sections',
             'evaluations',
+            'evaluation_aggregates',
             'advice',
         )
 
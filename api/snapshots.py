@@ -0,0 +1,127 @@
+"""
+Static JSON snapshots of the API. Between scrapes the data doesn't change, so
+the terms, subjects and full course listing of each term are rendered to
+files in SNAPSHOTS_STORAGE, from which they're served without touching Django
+or the database. The worker rebuilds them after each import, so the storage
+must be shared with the web servers in production. A manifest records the
+version of each term snapshotted, so that stale snapshots are never served
+and unchanged terms aren't rebuilt.
+"""
+from __future__ import absolute_import, unicode_literals
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import get_storage_class
+from django.db.models import Max
+import hashlib
+import json
+import tempfile
+
+from .export import chunked, to_json
+from .models import Course, Subject, Term
+from .serializers import CourseSerializer, SubjectSerializer, TermSerializer
+
+#: Name of the file recording the version of each term snapshotted
+MANIFEST = 'manifest.json'
+
+
+def get_storage():
+    """Returns the storage snapshots are written to and served from."""
+    return get_storage_class(settings.SNAPSHOTS_STORAGE)(
+        **settings.SNAPSHOTS_STORAGE_OPTIONS)
+
+
+def term_version(term):
+    """
+    Returns the version of the given term's data: the last time any of its
+    courses was updated, as a string.
+    """
+    version = Course.objects.filter(term=term).aggregate(
+        Max('last_updated'))['last_updated__max']
+    return version.isoformat() if version else None
+
+
+def courses_name(term_code, version):
+    """
+    Returns the name of the file with the given version of the courses of a
+    term. Each version gets its own name, so caches never serve an old one.
+    """
+    digest = hashlib.sha1(str(version)).hexdigest()[:12]
+    return '%s/courses-%s.json' % (term_code, digest)
+
+
+def write_file(storage, name, chunks):
+    """
+    Writes the given chunks of text to a file in the storage, replacing it.
+    The chunks are spooled to disk first, rather than held in memory.
+    """
+    with tempfile.TemporaryFile() as f:
+        for chunk in chunks:
+            f.write(chunk.encode('utf-8'))
+        f.seek(0)
+        storage.delete(name)
+        storage.save(name, File(f))
+
+
+def iter_courses(queryset):
+    """Yields the given courses as a JSON array, a course at a time."""
+    yield '['
+    separator = ''
+    for chunk in chunked(queryset):
+        for data in CourseSerializer(chunk, many=True).data:
+            yield separator + to_json(data)
+            separator = ',\n'
+    yield ']\n'
+
+
+def build_snapshots(courses_queryset, terms=None, force=False, storage=None):
+    """
+    Writes snapshots of all terms and subjects, and of the courses of the
+    given terms, or every term if none are given. courses_queryset is the
+    queryset to render courses from, with their relations prefetched. The
+    courses of terms that haven't changed since their last snapshot are only
+    written again if force is set. Returns the terms written.
+    """
+    storage = storage or get_storage()
+    write_file(storage, 'terms.json', [to_json(TermSerializer(
+        Term.objects.all(), many=True).data)])
+    write_file(storage, 'subjects.json', [to_json(SubjectSerializer(
+        Subject.objects.all(), many=True).data)])
+
+    manifest = read_manifest(storage)
+    written = []
+    for term in terms or Term.objects.all():
+        key = str(term.code)
+        version = term_version(term)
+        if not force and key in manifest and manifest[key] == version:
+            continue
+
+        write_file(storage, courses_name(term.code, version),
+                   iter_courses(courses_queryset.filter(term=term)))
+        previous = manifest.get(key, version)
+        manifest[key] = version
+        write_file(storage, MANIFEST, [to_json(manifest)])
+        if previous != version:
+            storage.delete(courses_name(term.code, previous))
+        written.append(term)
+    return written
+
+
+def read_manifest(storage=None):
+    storage = storage or get_storage()
+    if not storage.exists(MANIFEST):
+        return {}
+    with storage.open(MANIFEST) as f:
+        return json.loads(f.read().decode('utf-8'))
+
+
+def courses_url(term):
+    """
+    Returns the URL of the snapshot of the given term's courses, or None if
+    there is no snapshot of its current version.
+    """
+    storage = get_storage()
+    snapshotted = read_manifest(storage).get(str(term.code))
+    version = term_version(term)
+    if snapshotted is None or snapshotted != version:
+        return None
+    return storage.url(courses_name(term.code, version))
@@ -2,14 +2,23 @@
 Tasks to scrape the registrar for the API.
 """
 from __future__ import absolute_import, unicode_literals
+from datetime import timedelta
+import hashlib
+import json
+
 from celery import shared_task, group
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.timezone import is_aware, localtime, now
 
 from .scrapers import scrape_term
 from .scrapers import scrape_subjects
 from .scrapers import scrape_courses
 from .scrapers import scrape_course_details
 from .scrapers import scrape_evals
+from .scrapers import scrape_many
 
 from .models import Term
 from .models import Subject
@@ -17,12 +26,60 @@ from .models import Course
 from .models import CourseNumber
 from .models import Instructor
 from .models import Section
+from .models import Meeting
 from .models import Evaluation
+from .models import EvaluationAggregate
+from .models import EnrollmentSnapshot
 from .models import Advice
+from .models import canonical_question
+from .models import course_sort_key
+
+from .bulk import bulk_insert_ignoring_conflicts
+from .bulk import bulk_update
+from .caching import bump_generation
+from .schedules import days_string
+from .schedules import encode_mask
+from .schedules import parse_time
+from .schedules import section_mask
+from .search import update_advice_vectors
+from .search import update_search_vectors
+from .snapshots import build_snapshots
+from .views import CourseViewSet
 
 logger = get_task_logger(__name__)
 
 
+#: Fields of a course's web feeds data that depend on the subject it was
+#: listed under, rather than on the course
+SUBJECT_FIELDS = ('subj_code', 'subj_name', 'catalog_number',
+                  'cross_listings')
+
+
+def course_number_keys(course_data, subj_code):
+    """
+    Returns the (subject code, number) of every number of a course listed
+    under the given subject, starting with its number in that subject.
+    """
+    keys = [(subj_code, course_data['catalog_number'])]
+    keys += [(xlist_data['subject'], xlist_data['catalog_number'])
+             for xlist_data in course_data.get('cross_listings', [])]
+    return keys
+
+
+def feed_hash(course_data, subj_code):
+    """
+    Returns a stable hash of the given web feeds data of a course listed
+    under the given subject, used to tell whether the course changed since it
+    was last imported. A cross-listed course hashes the same in the feed of
+    every subject it's listed under.
+    """
+    data = {key: value for key, value in course_data.iteritems()
+            if key not in SUBJECT_FIELDS}
+    data['numbers'] = sorted(set(course_number_keys(course_data, subj_code)))
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(encoded).hexdigest()
+
+
 @shared_task
 def import_terms():
     """
@@ -45,6 +102,7 @@ def import_terms():
         )
         if created:
             logger.info('created term meta %s' % term)
+            bump_generation(term.code)
 
     return terms
 
@@ -68,127 +126,395 @@ def import_subjects():
         )
         if created:
             logger.info('created subject meta %s' % subject)
+            bump_generation()
 
     return subjects
 
 
 @shared_task
-def import_courses_in_subject(term_code, subj_code):
+def import_courses_in_subject(term_code, subj_code, force=False):
     """
     Scrapes all courses from web feeds and inserts them into the database.
     Returns a list of the course ids found.
     Fails loudly if a subject is not already in the database, so make sure that
     scrape_subjects is run first.
+
+    The whole subject is written in one transaction with a fixed number of
+    bulk queries, rather than a few queries per course, section and meeting.
+    Courses whose feed data hashes the same as on their last import are
+    skipped entirely, unless force is set.
     """
-    subject = Subject.objects.get(code=subj_code)
     term = Term.objects.get(code=term_code)
-    courses = scrape_courses(term_code, subj_code)
-    course_ids = []
-
-    def import_crosslistings(xlists_data, course):
+    courses_data = list(scrape_courses(term_code, subj_code))
+    existing = {c.course_id: c for c in Course.objects.filter(
+        term=term,
+        course_id__in=[c['course_id'] for c in courses_data],
+    )}
+
+    hashes = {c['course_id']: feed_hash(c, subj_code) for c in courses_data}
+    unchanged = [existing[c['course_id']] for c in courses_data
+                 if not force and c['course_id'] in existing and
+                 existing[c['course_id']].feed_hash == hashes[c['course_id']]]
+    unchanged_ids = set(course.course_id for course in unchanged)
+    courses_data = [c for c in courses_data
+                    if c['course_id'] not in unchanged_ids]
+    logger.info('attempting import of %d courses in %s, %d unchanged'
+                % (len(courses_data), subj_code, len(unchanged)))
+
+    def import_course_numbers(courses_data):
         """
-        Import the given crosslistings data into the course, setting up the
-        proper many to one relationship as well.
+        Import every primary and cross-listed course number used by the given
+        courses, returning a mapping of (subject code, number) to the
+        CourseNumber.
         """
-        for xlist_data in xlists_data:
-            subject = Subject.objects.get(code=xlist_data['subject'])
-            course_num, created = subject.course_numbers.get_or_create(
-                number=xlist_data['catalog_number'],
-            )
-            course_num.course = course
-            course_num.save()
-
-    def import_instructors(instructors_data, course):
+        keys = set()
+        for course_data in courses_data:
+            keys.update(course_number_keys(course_data, subj_code))
+
+        subjects = {s.code: s for s in Subject.objects.filter(
+            code__in=set(code for code, _ in keys))}
+        missing_subjects = set(code for code, _ in keys) - set(subjects)
+        if missing_subjects:
+            raise Subject.DoesNotExist('subjects %s do not exist'
+                                       % ', '.join(sorted(missing_subjects)))
+
+        existing = CourseNumber.objects.select_related('subject').filter(
+            subject__in=subjects.values(),
+            number__in=set(number for _, number in keys),
+        )
+        course_nums = {(n.subject.code, n.number): n for n in existing}
+
+        new_nums = [CourseNumber(subject=subjects[code], number=number)
+                    for code, number in keys if (code, number)
+                    not in course_nums]
+        if new_nums:
+            # Other subjects being imported at the same time may share some
+            # of these numbers, so use whichever rows made it in
+            created = bulk_insert_ignoring_conflicts(new_nums)
+            course_nums = {(n.subject.code, n.number): n
+                           for n in existing.all()}
+            logger.info('created %d course numbers' % created)
+
+        return course_nums
+
+    def import_courses(courses_data, course_nums):
         """
-        Import the given instructors data into the database.
-        Does not associate them to the course.
+        Import the given courses into the term, returning them in the same
+        order as the data.
         """
-        for instructor_data in instructors_data:
-            logger.info('attempting import of instructor %s'
-                        % instructor_data['emplid'])
-            instructor, created = Instructor.objects.get_or_create(
-                emplid=instructor_data['emplid'],
-                defaults={
-                    'first_name': instructor_data['first_name'],
-                    'last_name': instructor_data['last_name'],
-                },
-            )
-            instructor.courses.add(course)
-            if created:
-                logger.info('created instructor %s' % instructor)
-
-    def import_meetings(meetings_data, section):
-        """Import and overwrite the given meetings data into the course."""
-        section.meetings.all().delete()
-        for meeting_data in meetings_data:
-            location = ''
-            if 'room' in meeting_data:
-                location = '%s %s' % (meeting_data['building']['name'],
-                                      meeting_data['room'])
-
-            logger.info('attempting import of meeting at %s' % location)
-            meeting = section.meetings.create(
-                start_time=meeting_data['start_time'],
-                end_time=meeting_data['end_time'],
-                location=location,
-            )
-            logger.info('created meeting %s' % meeting)
-
-    def import_sections(sections_data, course):
-        """Import and overwrite the given sections data into the course."""
-        course.sections.all().delete()
-        for section_data in sections_data:
-            logger.info('attempting import of section %s'
-                        % section_data['class_number'])
-            section = course.sections.create(
-                class_id=section_data['class_number'],
-                name=section_data['section'],
-                type=section_data['type_name'],
-                status=section_data['status'],
-                enrollment=int(section_data['enrollment']),
-                capacity=int(section_data['capacity']),
+        courses = []
+        new_courses = []
+        updated_courses = []
+        for course_data in courses_data:
+            course = existing.get(course_data['course_id'])
+            if course is None:
+                course = Course(course_id=course_data['course_id'], term=term)
+                new_courses.append(course)
+            else:
+                updated_courses.append(course)
+
+            # A cross-listed course keeps the primary number it was first
+            # imported with, rather than taking that of whichever of its
+            # subjects was imported last
+            keys = course_number_keys(course_data, subj_code)
+            primary_key = next(
+                (key for key in keys
+                 if course_nums[key].id == course.primary_number_id),
+                keys[0])
+
+            course.title = course_data['title']
+            course.description = course_data['detail']['description']
+            course.primary_number = course_nums[primary_key]
+            course.sort_key = course_sort_key(term.code, primary_key[0],
+                                              primary_key[1],
+                                              course.course_id)
+            course.feed_hash = hashes[course.course_id]
+            course.last_updated = now()
+            courses.append(course)
+
+        if new_courses:
+            # A course imported by another subject at the same time is
+            # updated instead
+            bulk_insert_ignoring_conflicts(new_courses)
+            ids = dict(Course.objects.filter(
+                term=term,
+                course_id__in=[c.course_id for c in new_courses],
+            ).values_list('course_id', 'id'))
+            for course in new_courses:
+                if ids[course.course_id] != course.id:
+                    course.id = ids[course.course_id]
+                    updated_courses.append(course)
+        bulk_update(updated_courses, ['title', 'description', 'primary_number',
+                                      'sort_key', 'feed_hash', 'last_updated'])
+        logger.info('created %d and updated %d courses in %s'
+                    % (len(new_courses), len(updated_courses), subj_code))
+
+        return courses
+
+    def import_crosslistings(courses_data, courses, course_nums):
+        """
+        Point the primary and cross-listed numbers of each course at it,
+        setting up the proper many to one relationship, and record them as
+        the numbers of the course in this term.
+        """
+        Link = Course.numbers.through
+        changed_nums = []
+        links = []
+        for course_data, course in zip(courses_data, courses):
+            for key in set(course_number_keys(course_data, subj_code)):
+                course_num = course_nums[key]
+                links.append(Link(course=course, coursenumber=course_num))
+                if course_num.course_id != course.id:
+                    course_num.course = course
+                    changed_nums.append(course_num)
+
+        bulk_update(changed_nums, ['course'])
+
+        # Replace the numbers of each course, like numbers.set()
+        Link.objects.filter(course__in=courses).delete()
+        bulk_insert_ignoring_conflicts(links)
+
+    def import_instructors(courses_data, courses):
+        """
+        Import the given instructors data into the database, and associate
+        them to their courses.
+        """
+        instructors_data = {}
+        for course_data in courses_data:
+            for instructor_data in course_data['instructors']:
+                instructors_data[instructor_data['emplid']] = instructor_data
+
+        instructors = {i.emplid: i for i in Instructor.objects.filter(
+            emplid__in=instructors_data.keys())}
+        new_instructors = [
+            Instructor(
+                emplid=emplid,
+                first_name=instructor_data['first_name'],
+                last_name=instructor_data['last_name'],
             )
-            logger.info('imported section %s' % section)
-
-            import_meetings(section_data['schedule']['meetings'], section)
-
-    for course_data in courses:
-        logger.info('attempting import of course %s' % course_data['guid'])
-
-        course_num, _ = subject.course_numbers.get_or_create(
-            number=course_data['catalog_number'],
-        )
-
-        course, created = Course.objects.get_or_create(
-            course_id=course_data['course_id'],
-            term=term,
-            defaults={
-                'title': course_data['title'],
-                'term': term,
-                'primary_number': course_num,
-                'description': course_data['detail']['description'],
-            },
-        )
-        # course.cross_listings.clear()
-        course.primary_number = course_num
-        course.save()
-
-        course_num.course = course
-        course_num.save()
-
-        if created:
-            logger.info('imported course %s' % course)
+            for emplid, instructor_data in instructors_data.iteritems()
+            if emplid not in instructors
+        ]
+        if new_instructors:
+            # Instructors teach in many subjects, which may be being imported
+            # at the same time, so use whichever rows made it in
+            created = bulk_insert_ignoring_conflicts(new_instructors)
+            instructors = {i.emplid: i for i in Instructor.objects.filter(
+                emplid__in=instructors_data.keys())}
+            logger.info('created %d instructors' % created)
+
+        # Only add the links that don't exist yet, like instructors.add()
+        Link = Course.instructors.through
+        links = set(Link.objects.filter(course__in=courses).values_list(
+            'course_id', 'instructor_id'))
+        new_links = []
+        for course_data, course in zip(courses_data, courses):
+            for instructor_data in course_data['instructors']:
+                instructor = instructors[instructor_data['emplid']]
+                if (course.id, instructor.id) not in links:
+                    links.add((course.id, instructor.id))
+                    new_links.append(Link(course=course,
+                                          instructor=instructor))
+        bulk_insert_ignoring_conflicts(new_links)
+
+    def import_sections(courses_data, courses):
+        """
+        Import and overwrite the given sections and meetings data into the
+        courses.
+        """
+        Section.objects.filter(course__in=courses).delete()
+
+        sections = []
+        meetings = []
+        for course_data, course in zip(courses_data, courses):
+            for section_data in course_data['classes']:
+                section = Section(
+                    course=course,
+                    class_id=section_data['class_number'],
+                    name=section_data['section'],
+                    type=section_data['type_name'],
+                    status=section_data['status'],
+                    enrollment=int(section_data['enrollment']),
+                    capacity=int(section_data['capacity']),
+                )
+                sections.append(section)
+
+                section_meetings = []
+                for meeting_data in section_data['schedule']['meetings']:
+                    location = ''
+                    if 'room' in meeting_data:
+                        location = '%s %s' % (
+                            meeting_data['building']['name'],
+                            meeting_data['room'])
+
+                    section_meetings.append(Meeting(
+                        section=section,
+                        start_time=parse_time(meeting_data['start_time']),
+                        end_time=parse_time(meeting_data['end_time']),
+                        days=days_string(meeting_data.get('days', [])),
+                        location=location,
+                    ))
+                for meeting in section_meetings:
+                    meeting.update_indexed_times()
+                section.occupancy = encode_mask(section_mask(
+                    section_meetings))
+                meetings.extend(section_meetings)
+
+        Section.objects.bulk_create(sections)
+        Meeting.objects.bulk_create(meetings)
+        logger.info('imported %d sections and %d meetings in %s'
+                    % (len(sections), len(meetings), subj_code))
+
+    courses = []
+    if courses_data:
+        with transaction.atomic():
+            course_nums = import_course_numbers(courses_data)
+            courses = import_courses(courses_data, course_nums)
+            import_crosslistings(courses_data, courses, course_nums)
+            import_instructors(courses_data, courses)
+            import_sections(courses_data, courses)
+            update_search_vectors(courses)
+        bump_generation(term_code)
+        queue_snapshot(term_code)
+
+    # Only queue follow-up scrapes once the courses are committed. Unchanged
+    # courses are retried only if their last scrape never succeeded, or, for
+    # evaluations, found none published yet.
+    details_ids = [course.course_id for course in courses]
+    details_ids += [course.course_id for course in unchanged
+                    if not course.details_scraped]
+    evals_ids = [course.course_id for course in courses]
+    evals_ids += [course.course_id for course in unchanged
+                  if not course.evals_scraped]
+    if details_ids or evals_ids:
+        import_course_pages.delay(term_code, details_ids, evals_ids)
+
+    return [course.course_id for course in courses + unchanged]
+
+
+def aggregate_evals(stats):
+    """
+    Averages the given evaluation stats by canonical question, also averaging
+    all of them as the 'mean' question. Returns a dict of question to
+    (response average, number of questions averaged).
+    """
+    groups = {}
+    for question_text, response in stats.iteritems():
+        groups.setdefault(canonical_question(question_text), []).append(
+            response)
+    if stats:
+        groups['mean'] = stats.values()
+    return {question: (round(sum(responses) / len(responses), 2),
+                       len(responses))
+            for question, responses in groups.iteritems()}
+
+
+def overall_rating(aggregates):
+    """
+    Returns the overall rating of a course given its evaluation aggregates:
+    the response to the overall quality question if there is one, or else the
+    mean of all responses. Returns None if there are no responses.
+    """
+    for question in ('overall', 'mean'):
+        if question in aggregates:
+            return aggregates[question][0]
+    return None
 
-        if 'cross_listings' in course_data:
-            import_crosslistings(course_data['cross_listings'], course)
-        import_instructors(course_data['instructors'], course)
-        import_sections(course_data['classes'], course)
 
-        import_details.delay(term_code, course.course_id)
-        import_evals.delay(term_code, course.course_id)
+def save_details(courses_details):
+    """
+    Supplements existing courses with the given (course, details) pairs in a
+    fixed number of queries. Assumes that instructors are already in the DB.
+    """
+    emplids = set()
+    for course, details in courses_details:
+        course.additional_info = details['additional_info']
+        course.pdf = details['enroll_params']['pdf']
+        course.pdf_only = details['enroll_params']['pdf_only'] or False
+        course.audit = details['enroll_params']['audit']
+        course.dist_req = details['dist_req'] or ''
+        course.details_scraped = True
+        course.last_updated = now()
+        emplids.update(details['instructors'])
+
+    instructors = {i.emplid: i for i in Instructor.objects.filter(
+        emplid__in=emplids)}
+    courses = [course for course, _ in courses_details]
+
+    # Replace the instructors of each course, like instructors.set()
+    Link = Course.instructors.through
+    Link.objects.filter(course__in=courses).delete()
+    Link.objects.bulk_create([
+        Link(course=course, instructor=instructors[emplid])
+        for course, details in courses_details
+        for emplid in set(details['instructors']) if emplid in instructors
+    ])
+
+    bulk_update(courses, ['additional_info', 'pdf', 'pdf_only', 'audit',
+                          'dist_req', 'details_scraped', 'last_updated'])
+    update_search_vectors(courses)
+
+
+def save_evals(courses_evals):
+    """
+    Replaces the evaluations and advice of the given courses with the given
+    (course, (stats, comments)) pairs in a fixed number of queries.
+    """
+    courses = [course for course, _ in courses_evals]
+    Evaluation.objects.filter(course__in=courses).delete()
+    EvaluationAggregate.objects.filter(course__in=courses).delete()
+    Advice.objects.filter(course__in=courses).delete()
+
+    evaluations = []
+    aggregates = []
+    advice = []
+    for course, (stats, comments) in courses_evals:
+        for question, response in stats.iteritems():
+            evaluations.append(Evaluation(
+                course=course,
+                question_text=question,
+                response_avg=response,
+            ))
+        advice += [Advice(course=course, text=comment)
+                   for comment in comments]
+
+        course_aggregates = aggregate_evals(stats)
+        for question, (avg, count) in course_aggregates.iteritems():
+            aggregates.append(EvaluationAggregate(
+                course=course,
+                term_id=course.term_id,
+                question=question,
+                response_avg=avg,
+                response_count=count,
+            ))
+        course.rating = overall_rating(course_aggregates)
+        # Evaluations are only published after the term ends, so keep
+        # scraping until there are some
+        course.evals_scraped = bool(stats)
+        course.last_updated = now()
+
+    Evaluation.objects.bulk_create(evaluations)
+    EvaluationAggregate.objects.bulk_create(aggregates)
+    Advice.objects.bulk_create(advice)
+    update_advice_vectors(courses)
+    bulk_update(courses, ['rating', 'evals_scraped', 'last_updated'])
+
+
+#: Seconds that a task importing a single page is given
+PAGE_TIME_LIMIT = 30
+
+
+def course_pages_time_limit(pages):
+    """
+    Returns the seconds import_course_pages is given to scrape the given
+    number of pages: as long as importing them one at a time would be allowed
+    to take, running SCRAPER_CONCURRENCY at a time.
+    """
+    rounds = -(-pages // settings.SCRAPER_CONCURRENCY)  # rounded up
+    return max(rounds, 1) * PAGE_TIME_LIMIT
 
 
-@shared_task(time_limit=30)
+@shared_task(time_limit=PAGE_TIME_LIMIT)
 def import_details(term_code, course_id):
     """
     Supplements existing course information with details, if possible.
@@ -200,21 +526,14 @@ def import_details(term_code, course_id):
                                 course_id=course_id)
     details = scrape_course_details(term_code, course_id)
 
-    course.additional_info = details['additional_info']
-    course.pdf = details['enroll_params']['pdf']
-    course.pdf_only = details['enroll_params']['pdf_only'] or False
-    course.audit = details['enroll_params']['audit']
-    course.dist_req = details['dist_req'] or ''
-
-    instructors = Instructor.objects.filter(emplid__in=details['instructors'])
-    course.instructors.set(instructors)
-
-    course.details_scraped = True
-    course.save()
+    with transaction.atomic():
+        save_details([(course, details)])
+    bump_generation(term_code)
+    queue_snapshot(term_code)
     logger.info('imported details for %s in term %s' % (course_id, term_code))
 
 
-@shared_task(time_limit=30)
+@shared_task(time_limit=PAGE_TIME_LIMIT)
 def import_evals(term_code, course_id):
     """
     Delete and scrape all evaluations for a given course.
@@ -225,29 +544,246 @@ def import_evals(term_code, course_id):
                                 term__code=int(term_code))
     stats, comments = scrape_evals(term_code, course_id)
 
-    course.evaluations.all().delete()
-    for question, response in stats.iteritems():
-        course.evaluations.create(
-            question_text=question,
-            response_avg=response,
-        )
+    with transaction.atomic():
+        save_evals([(course, (stats, comments))])
+    bump_generation(term_code)
+    queue_snapshot(term_code)
+    logger.info('imported evals for %s in term %s' % (course_id, term_code))
 
-    course.advice.all().delete()
-    for comment in comments:
-        course.advice.create(text=comment)
 
-    course.evals_scraped = True
-    course.save()
-    logger.info('imported evals for %s in term %s' % (course_id, term_code))
+@shared_task
+def import_course_pages(term_code, details_ids=(), evals_ids=()):
+    """
+    Scrapes the details and evaluations of the given courses concurrently,
+    saving them in batches of SCRAPER_BATCH_SIZE as they arrive. Courses that
+    fail to scrape are queued to be retried one at a time, as are those not
+    scraped within course_pages_time_limit, so a stuck host can't hang the
+    worker.
+    """
+    logger.info('attempting import of %d details and %d evals in term %s'
+                % (len(details_ids), len(evals_ids), term_code))
+    savers = {
+        scrape_course_details: save_details,
+        scrape_evals: save_evals,
+    }
+    retries = {
+        scrape_course_details: import_details,
+        scrape_evals: import_evals,
+    }
+    jobs = [(scrape_course_details, (term_code, course_id))
+            for course_id in details_ids]
+    jobs += [(scrape_evals, (term_code, course_id))
+             for course_id in evals_ids]
+    batches = {scraper: {} for scraper in savers}
+
+    def save_batch(scraper):
+        """Save and clear the pending results of the given scraper."""
+        results = batches[scraper]
+        courses = Course.objects.filter(term__code=int(term_code),
+                                        course_id__in=results.keys())
+        with transaction.atomic():
+            savers[scraper]([(course, results[course.course_id])
+                             for course in courses])
+        bump_generation(term_code)
+        queue_snapshot(term_code)
+        logger.info('imported %d pages in term %s'
+                    % (len(results), term_code))
+        batches[scraper] = {}
+
+    unfinished = set(jobs)
+    for job, result, error in scrape_many(
+            jobs, course_pages_time_limit(len(jobs))):
+        unfinished.discard(job)
+        scraper, args = job
+        _, course_id = args
+        if error is not None:
+            logger.warning('failed to scrape %s for %s in term %s: %r'
+                           % (scraper.__name__, course_id, term_code, error))
+            retries[scraper].delay(*args)
+            continue
+
+        batches[scraper][course_id] = result
+        if len(batches[scraper]) >= settings.SCRAPER_BATCH_SIZE:
+            save_batch(scraper)
+
+    for scraper in savers:
+        if batches[scraper]:
+            save_batch(scraper)
+
+    if unfinished:
+        logger.warning('timed out scraping %d pages in term %s, queuing them'
+                       % (len(unfinished), term_code))
+        for scraper, args in jobs:
+            if (scraper, args) in unfinished:
+                retries[scraper].delay(*args)
 
 
 @shared_task
-def import_courses_in_term(term_code):
+def import_courses_in_term(term_code, force=False):
     """
-    Scrapes all courses in the given term.
-    TODO: Make this incremental.
+    Scrapes all courses in the given term. Only courses that changed since the
+    last import are written, unless force is set.
     """
     subjects = [subject.code for subject in Subject.objects.all()]
-    tasks = [import_courses_in_subject.s(term_code, subject)
+    tasks = [import_courses_in_subject.s(term_code, subject, force)
              for subject in subjects]
     group(tasks)()
+
+
+def snapshot_pending_key(term_code):
+    return 'api:snapshot-pending:%s' % term_code
+
+
+def queue_snapshot(term_code):
+    """
+    Rebuilds the snapshot of the given term SNAPSHOT_DELAY seconds from now,
+    unless a rebuild is already queued, so that a burst of imports leads to
+    one rebuild. Snapshots are only served, and so built, if
+    API_SNAPSHOT_REDIRECT is set.
+    """
+    if settings.API_SNAPSHOT_REDIRECT and cache.add(
+            snapshot_pending_key(term_code), True, settings.SNAPSHOT_DELAY):
+        snapshot_term.apply_async((term_code,),
+                                  countdown=settings.SNAPSHOT_DELAY)
+
+
+@shared_task
+def snapshot_term(term_code):
+    """
+    Rebuilds the snapshots of the given term, and of all terms and subjects,
+    if its data changed since they were last built.
+    """
+    cache.delete(snapshot_pending_key(term_code))
+    written = build_snapshots(CourseViewSet.queryset,
+                              [Term.objects.get(code=term_code)])
+    logger.info('%s snapshot of term %s'
+                % ('rebuilt' if written else 'kept', term_code))
+
+
+@shared_task
+def refresh_enrollments_in_subject(term_code, subj_code):
+    """
+    Updates the enrollment, capacity and status of the sections of the
+    courses in a subject from web feeds, in place. Unlike a full import, only
+    the sections whose numbers changed are written, and nothing is deleted,
+    so this is cheap enough to run every few minutes. Sections that are new
+    or gone are left to the next full import.
+
+    Each change is also appended to the enrollment history of the section,
+    as is the first refresh of a section, where its history starts.
+    """
+    # Always revalidate the feed, which a full import may have cached
+    classes = {}
+    for course_data in scrape_courses(term_code, subj_code, ttl=0):
+        for section_data in course_data['classes']:
+            classes[course_data['course_id'], section_data['class_number']] \
+                = section_data
+
+    sections = Section.objects.filter(
+        course__term__code=term_code,
+        course__course_id__in=set(course_id for course_id, _ in classes),
+    ).select_related('course').only(
+        'class_id', 'enrollment', 'capacity', 'status', 'course__course_id')
+
+    term = Term.objects.get(code=term_code)
+    tracked = set(EnrollmentSnapshot.objects.filter(
+        term=term,
+        class_id__in=set(class_id for _, class_id in classes),
+    ).values_list('class_id', flat=True).distinct())
+
+    changed = []
+    snapshots = []
+    for section in sections:
+        section_data = classes.get((section.course.course_id,
+                                    section.class_id))
+        if section_data is None:
+            continue
+        numbers = (int(section_data['enrollment']),
+                   int(section_data['capacity']),
+                   section_data['status'])
+        if numbers != (section.enrollment, section.capacity, section.status):
+            section.enrollment, section.capacity, section.status = numbers
+            changed.append(section)
+        elif section.class_id in tracked:
+            continue
+
+        # Record the change, or where the history of the section starts
+        snapshots.append(EnrollmentSnapshot(
+            term=term,
+            class_id=section.class_id,
+            enrollment=section.enrollment,
+            capacity=section.capacity,
+            status=section.status,
+        ))
+
+    with transaction.atomic():
+        EnrollmentSnapshot.objects.bulk_create(snapshots)
+        if changed:
+            bulk_update(changed, ['enrollment', 'capacity', 'status'])
+            Course.objects.filter(
+                pk__in=set(section.course_id for section in changed),
+            ).update(last_updated=now())
+    if snapshots:
+        bump_generation(term_code)
+    if changed:
+        queue_snapshot(term_code)
+    logger.info('refreshed enrollment of %d sections in %s'
+                % (len(changed), subj_code))
+
+
+@shared_task
+def refresh_enrollments():
+    """
+    Refreshes the enrollment of every section in the current term, one task
+    per subject. Run periodically by Celery beat during course selection, see
+    ENROLLMENT_REFRESH_INTERVAL.
+    """
+    term_code = scrape_term('current')[0]['code']
+    if not Term.objects.filter(code=term_code).exists():
+        logger.warning('not refreshing enrollments in term %s, which has not '
+                       'been imported' % term_code)
+        return
+
+    # Like this task, each subject's is dropped if still queued by the time
+    # the next refresh is due
+    expires = settings.ENROLLMENT_REFRESH_INTERVAL or None
+    subjects = [subject.code for subject in Subject.objects.all()]
+    group(refresh_enrollments_in_subject.s(term_code, subject)
+          .set(expires=expires) for subject in subjects)()
+
+
+# Keeps only the last snapshot of each section on each day before the cutoff
+COMPACT_ENROLLMENT_SQL = """
+DELETE FROM api_enrollmentsnapshot s
+WHERE s.time < %(cutoff)s
+AND EXISTS (
+    SELECT 1 FROM api_enrollmentsnapshot later
+    WHERE later.term_id = s.term_id
+    AND later.class_id = s.class_id
+    AND later.time > s.time
+    AND (later.time AT TIME ZONE %(tz)s)::date =
+        (s.time AT TIME ZONE %(tz)s)::date
+)
+"""
+
+
+@shared_task
+def compact_enrollment_history():
+    """
+    Rolls the enrollment snapshots older than ENROLLMENT_HISTORY_RETENTION
+    days up into one per section per day, the last of the day. Only whole
+    days are compacted.
+    """
+    today = now()
+    if is_aware(today):
+        today = localtime(today)
+    cutoff = today.replace(hour=0, minute=0, second=0, microsecond=0) - \
+        timedelta(days=settings.ENROLLMENT_HISTORY_RETENTION)
+    with connection.cursor() as cursor:
+        cursor.execute(COMPACT_ENROLLMENT_SQL, {
+            'cutoff': cutoff,
+            'tz': settings.TIME_ZONE,
+        })
+        deleted = cursor.rowcount
+    logger.info('compacted %d enrollment snapshots from before %s'
+                % (deleted, cutoff))
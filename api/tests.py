@@ -1,3 +1,1355 @@
-from django.test import TestCase
+from __future__ import unicode_literals
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now, utc
+import mock
+import requests
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from api import scrapers
+from api import tasks
+from api.caching import bump_generation, generation_key, get_generation
+from api.caching import request_generation
+from api.export import export_courses
+from api.httpcache import ResponseCache
+from api.schedules import ScheduleGenerator, decode_mask, encode_mask
+from api.schedules import meeting_mask, parse_days, parse_time
+from api.schedules import section_mask, section_options
+from api.search import update_advice_vectors, update_search_vectors
+from api.snapshots import build_snapshots, courses_name, term_version
+from api.views import CourseViewSet
+from api.models import Course, CourseNumber, EnrollmentSnapshot, Instructor
+from api.models import Meeting, Section, Subject, Term
+from api.models import course_sort_key
+
+
+#: Directory of sample registrar and evaluation pages
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'pages')
+
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+
+    """
+    A local HTTP server that serves canned pages by path, and keeps track of
+    how many connections were opened to it and the status of each response.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, pages):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.pages = pages
+        self.connections = 0
+        self.statuses = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_port
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # allow keep-alive
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path not in self.server.pages:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.server.pages[path]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_response(self, code, *args):
+        self.server.statuses.append(code)
+        BaseHTTPRequestHandler.send_response(self, code, *args)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServerTestCase(SimpleTestCase):
+
+    """
+    Runs a StubServer for the duration of each test, and starts every test
+    with fresh scraper sessions and caches.
+    """
+
+    def setUp(self):
+        self.server = StubServer({
+            b'/page': b'<html><body><p id="hello">Hello!</p></body></html>',
+            b'/feed': b'{"term": [{"code": 1174}]}',
+        })
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        scrapers._session = None
+        scrapers._cache = None
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        scrapers._cache = None
+
+
+class HTTPClientTest(StubServerTestCase):
+
+    def test_fetch(self):
+        page = scrapers.fetch(self.server.url + '/page', {'term': 1174})
+        self.assertIn(b'Hello!', page)
+
+    def test_gzip_response(self):
+        response = scrapers.get_session().get(self.server.url + '/feed')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.json(), {'term': [{'code': 1174}]})
+
+    def test_connections_kept_alive(self):
+        for _ in range(5):
+            scrapers.fetch(self.server.url + '/page', {})
+        self.assertEqual(self.server.connections, 1)
+
+    def test_error_raises(self):
+        with self.assertRaises(requests.HTTPError):
+            scrapers.fetch(self.server.url + '/missing', {})
+
+
+class ResponseCacheTest(StubServerTestCase):
+
+    def setUp(self):
+        super(ResponseCacheTest, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache_settings = self.settings(SCRAPER_CACHE_DIR=self.cache_dir)
+        self.cache_settings.enable()
+
+    def tearDown(self):
+        super(ResponseCacheTest, self).tearDown()
+        self.cache_settings.disable()
+        shutil.rmtree(self.cache_dir)
+
+    def test_fresh_hit(self):
+        for _ in range(3):
+            body = scrapers.fetch(self.server.url + '/feed', {'a': 1}, 60)
+        self.assertEqual(json.loads(body), {'term': [{'code': 1174}]})
+        self.assertEqual(self.server.statuses, [200])
+
+    def test_stale_revalidated(self):
+        for _ in range(3):
+            body = scrapers.fetch(self.server.url + '/feed', {'a': 1}, 0)
+        self.assertEqual(json.loads(body), {'term': [{'code': 1174}]})
+        self.assertEqual(self.server.statuses, [200, 304, 304])
+
+    def test_keyed_by_params(self):
+        scrapers.fetch(self.server.url + '/feed', {'a': 1}, None)
+        scrapers.fetch(self.server.url + '/feed', {'a': 2}, None)
+        self.assertEqual(self.server.statuses, [200, 200])
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.cache_dir, max_size=2500)
+        urls = ['http://example.com/%d' % i for i in range(3)]
+        cache.set(urls[0], {}, b'x' * 1000, {})
+        cache.set(urls[1], {}, b'x' * 1000, {})
+        os.utime(cache.path(urls[0], {}), (200, 200))
+        os.utime(cache.path(urls[1], {}), (100, 100))
+        cache.set(urls[2], {}, b'x' * 1000, {})
+
+        self.assertIsNotNone(cache.get(urls[0], {}))
+        self.assertIsNone(cache.get(urls[1], {}))
+        self.assertIsNotNone(cache.get(urls[2], {}))
+
+    def test_evicted_while_read(self):
+        cache = ResponseCache(self.cache_dir, max_size=2500)
+        cache.set('http://example.com/', {}, b'x', {})
+        with mock.patch('api.httpcache.os.utime', side_effect=OSError):
+            self.assertEqual(cache.get('http://example.com/', {}).content,
+                             b'x')
+
+    def test_evals_only_cached_once_published(self):
+        self.server.pages[b'/evals'] = read_page('evals.html')
+        cache = scrapers.get_cache()
+        for path, published in ((b'/page', False), (b'/evals', True)):
+            url = self.server.url + path
+            params = {'terminfo': 1174, 'courseinfo': '000001'}
+            with mock.patch.object(scrapers, 'EVALUATION_BASE_URL', url):
+                stats, _ = scrapers.scrape_evals(1174, '000001')
+            self.assertEqual(bool(stats), published)
+            self.assertEqual(cache.get(url, params) is not None, published)
+
+
+class BenchmarkTest(StubServerTestCase):
+
+    """
+    Runs the benchmark command with the scraped sites pointed at the stub
+    server, which it should never have to go to.
+    """
+
+    allow_database_queries = True
+
+    def tearDown(self):
+        super(BenchmarkTest, self).tearDown()
+        scrapers._session = None  # drop the replaying session
+
+    def test_reports(self):
+        urls = {
+            'FEED_URL': '/feed',
+            'REGISTRAR_BASE_URL': '/details',
+            'EVALUATION_BASE_URL': '/evals',
+        }
+        out = StringIO()
+        with mock.patch.multiple(scrapers, **{
+                name: self.server.url + path
+                for name, path in urls.items()}):
+            call_command('benchmark', pages=PAGES_DIR, repeat=1, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('pages/sec', output)
+        self.assertIn('courses/sec', output)
+        self.assertRegexpMatches(
+            output, r'import_course_pages .* [\d.]+ queries/course')
+        self.assertRegexpMatches(output, r'peak memory: [\d.]+ MB')
+        self.assertEqual(self.server.connections, 0)
+
+
+class ParserTest(SimpleTestCase):
+
+    def test_details_match_html5lib(self):
+        page = read_page('course_details.html')
+        details = scrapers.parse_course_details(page)
+        with self.settings(SCRAPER_PARSER='html5lib'):
+            self.assertEqual(details, scrapers.parse_course_details(page))
+
+        self.assertEqual(details['instructors'], ['010000001', '010000002'])
+        self.assertEqual(len(details['classes']), 13)
+        self.assertEqual(details['classes'][0]['enroll_count'], 312)
+        self.assertTrue(details['enroll_params']['audit'])
+
+    def test_evals_match_html5lib(self):
+        page = read_page('evals.html')
+        stats, comments = scrapers.parse_evals(page)
+        with self.settings(SCRAPER_PARSER='html5lib'):
+            self.assertEqual((stats, comments), scrapers.parse_evals(page))
+
+        self.assertEqual(stats['Overall Quality of the Course'], 4.3)
+        self.assertEqual(len(comments), 40)
+
+    @override_settings(SCRAPER_PARSER='nonexistent')
+    def test_falls_back_to_html5lib(self):
+        page = read_page('course_details.html')
+        details = scrapers.parse_course_details(page)
+        self.assertEqual(len(details['classes']), 13)
+
+
+def create_course(term, subject, number, **kwargs):
+    """
+    Creates a course with the given number, along with a lecture, a precept,
+    evaluations, advice and an instructor.
+    """
+    kwargs.setdefault('title', '%s %s' % (subject.code, number))
+    kwargs.setdefault('rating', 4.5)
+    kwargs.setdefault('sort_key', course_sort_key(term.code, subject.code,
+                                                  number, number.zfill(6)))
+    course_num, _ = CourseNumber.objects.get_or_create(subject=subject,
+                                                       number=number)
+    course = Course.objects.create(
+        course_id='%06d' % int(number),
+        term=term,
+        primary_number=course_num,
+        **kwargs
+    )
+    course_num.course = course
+    course_num.save()
+    course.numbers.add(course_num)
+
+    instructor, _ = Instructor.objects.get_or_create(
+        emplid='9%s' % number, first_name='Ada', last_name='Lovelace')
+    course.instructors.add(instructor)
+
+    for name, start, end in (('L01', '10:00', '10:50'),
+                             ('P01', '13:30', '14:20')):
+        section = course.sections.create(
+            class_id='4%s%s' % (number, name), name=name, type='Lecture',
+            status='Open', enrollment=10, capacity=20)
+        meeting = section.meetings.create(
+            start_time=parse_time(start), end_time=parse_time(end),
+            days='MW', location='Friend Center 101')
+        section.occupancy = encode_mask(section_mask([meeting]))
+        section.save()
+
+    course.evaluations.create(question_text='Overall Quality of the Course',
+                              response_avg=4.5)
+    course.evaluations.create(question_text='Quality of Lectures',
+                              response_avg=4.0)
+    course.advice.create(text='Start the problem sets early.')
+    return course
+
+
+class EvaluationAggregateTest(SimpleTestCase):
+
+    def test_aggregated_by_canonical_question(self):
+        aggregates = tasks.aggregate_evals({
+            'Overall Quality of the Course': 4.0,
+            'Quality of Lectures': 3.0,
+            'Quality of Precepts': 4.5,
+            'Quality of Laboratories': 2.0,
+            'Quality of Readings': 3.5,
+            'Quality of Written Assignments': 3.0,
+            'Quality of Problem Sets': 4.0,
+            'Recommend to Other Students': 5.0,
+        })
+        self.assertEqual(aggregates['overall'], (4.0, 1))
+        self.assertEqual(aggregates['lectures'], (3.0, 1))
+        self.assertEqual(aggregates['precepts'], (4.5, 1))
+        self.assertEqual(aggregates['labs'], (2.0, 1))
+        self.assertEqual(aggregates['readings'], (3.5, 1))
+        self.assertEqual(aggregates['written'], (3.5, 2))
+        self.assertEqual(aggregates['other'], (5.0, 1))
+        self.assertEqual(aggregates['mean'], (3.63, 8))
+        self.assertEqual(tasks.overall_rating(aggregates), 4.0)
+
+    def test_rating_falls_back_to_mean(self):
+        aggregates = tasks.aggregate_evals({'Quality of Lectures': 3.0,
+                                            'Quality of Readings': 4.0})
+        self.assertEqual(tasks.overall_rating(aggregates), 3.5)
+        self.assertIsNone(tasks.overall_rating(tasks.aggregate_evals({})))
+
+
+def feed_course(course_id, subject, number, cross_listings=(),
+                emplid='910000001'):
+    """
+    Returns the web feeds data of a course with a lecture, as listed under the
+    given subject.
+    """
+    return {
+        'guid': '1174%s' % course_id,
+        'course_id': course_id,
+        'catalog_number': number,
+        'title': 'Course %s' % course_id,
+        'detail': {'description': ''},
+        'cross_listings': [{'subject': code, 'catalog_number': xlist_number}
+                           for code, xlist_number in cross_listings],
+        'instructors': [{'emplid': emplid, 'first_name': 'Ada',
+                         'last_name': 'Lovelace'}],
+        'classes': [{
+            'class_number': '4%s' % course_id[-4:],
+            'section': 'L01',
+            'type_name': 'Lecture',
+            'status': 'Open',
+            'enrollment': '10',
+            'capacity': '20',
+            'schedule': {'meetings': [{
+                'start_time': '10:00 AM', 'end_time': '10:50 AM',
+                'days': ['M', 'W'], 'building': {'name': 'Friend Center'},
+                'room': '101'}]},
+        }],
+    }
+
+
+class ImportTest(TestCase):
+
+    def setUp(self):
+        Term.objects.create(suffix='S2017', name='Spring 2017', code=1174,
+                            start_date=datetime.date(2017, 2, 6),
+                            end_date=datetime.date(2017, 6, 6))
+        for code in ('COS', 'EGR'):
+            Subject.objects.create(code=code, name=code)
+
+        # COS 333 is cross-listed as EGR 333, so it is in both feeds
+        self.feeds = {
+            'COS': [feed_course('000001', 'COS', '126'),
+                    feed_course('000003', 'COS', '333', [('EGR', '333')])],
+            'EGR': [feed_course('000002', 'EGR', '154'),
+                    feed_course('000003', 'EGR', '333', [('COS', '333')])],
+        }
+        patcher = mock.patch.object(tasks.import_course_pages, 'delay')
+        self.import_pages = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def import_subject(self, subj_code, force=False):
+        with mock.patch.object(tasks, 'scrape_courses',
+                               return_value=self.feeds[subj_code]):
+            return tasks.import_courses_in_subject(1174, subj_code, force)
+
+    def reimport_subject(self, subj_code, force=False):
+        """Imports a subject again, returning the queries that wrote."""
+        self.import_pages.reset_mock()
+        with CaptureQueriesContext(connection) as context:
+            self.import_subject(subj_code, force)
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+    def import_racing(self, model):
+        """
+        Imports COS, importing EGR just as COS is about to insert rows of the
+        given model, as if EGR were imported by another worker.
+        """
+        insert = tasks.bulk_insert_ignoring_conflicts
+
+        def racing_insert(objs, *args):
+            if objs and type(objs[0]) is model and not raced:
+                raced.append(model)
+                self.import_subject('EGR')
+            return insert(objs, *args)
+
+        raced = []
+        with mock.patch.object(tasks, 'bulk_insert_ignoring_conflicts',
+                               racing_insert):
+            self.import_subject('COS')
+        self.assertEqual(raced, [model])
+
+    def assert_imported(self):
+        self.assertEqual(Instructor.objects.count(), 1)
+        self.assertEqual(sorted(Course.objects.values_list(
+            'course_id', flat=True)), ['000001', '000002', '000003'])
+        self.assertEqual(CourseNumber.objects.count(), 4)
+        course = Course.objects.get(course_id='000003')
+        self.assertEqual(sorted(str(n) for n in course.numbers.all()),
+                         ['COS 333', 'EGR 333'])
+        self.assertEqual(course.instructors.count(), 1)
+        self.assertEqual(course.sections.count(), 1)
+        for course in Course.objects.all():
+            self.assertEqual(course.instructors.get().emplid, '910000001')
+
+    def test_subjects_sharing_rows(self):
+        self.import_subject('COS')
+        self.import_subject('EGR')
+        self.assert_imported()
+
+    def test_concurrent_numbers_and_courses(self):
+        self.import_racing(CourseNumber)
+        self.assert_imported()
+
+    def test_concurrent_instructors(self):
+        self.import_racing(Instructor)
+        self.assert_imported()
+
+    def test_unchanged_feed_not_rewritten(self):
+        self.import_subject('COS')
+        self.import_subject('EGR')
+        Course.objects.update(details_scraped=True, evals_scraped=True)
+
+        for subj_code in ('COS', 'EGR'):
+            self.assertEqual(self.reimport_subject(subj_code), [])
+            self.assertFalse(self.import_pages.called)
+
+    def test_cross_listed_course_imported_once(self):
+        self.import_subject('COS')
+        Course.objects.update(details_scraped=True, evals_scraped=True)
+        course = Course.objects.get(course_id='000003')
+        self.import_pages.reset_mock()
+        self.import_subject('EGR')
+
+        # EGR 333 hashes the same as COS 333, so only EGR 154 is written
+        self.import_pages.assert_called_once_with(1174, ['000002'],
+                                                  ['000002'])
+        self.assertEqual(Course.objects.get(course_id='000003').last_updated,
+                         course.last_updated)
+
+        # Even once rewritten from EGR, it keeps its primary number
+        self.reimport_subject('EGR', force=True)
+        rewritten = Course.objects.get(course_id='000003')
+        self.assertEqual(str(rewritten.primary_number), 'COS 333')
+        self.assertEqual(rewritten.sort_key, course.sort_key)
+
+    def test_force_rewrites_everything(self):
+        self.import_subject('COS')
+        Course.objects.update(details_scraped=True, evals_scraped=True)
+
+        self.assertTrue(self.reimport_subject('COS', force=True))
+        ids = ['000001', '000003']
+        self.import_pages.assert_called_once_with(1174, ids, ids)
+
+        with mock.patch('api.management.commands.scrape.celery.chain') \
+                as chain:
+            call_command('scrape', '--terms', '1174', '--force',
+                         stdout=StringIO())
+        terms, = chain.call_args[0][0]
+        self.assertEqual([task.args for task in terms.tasks],
+                         [('1174', True)])
+
+    def test_unscraped_pages_requeued(self):
+        self.import_subject('COS')
+        Course.objects.filter(course_id='000001').update(details_scraped=True)
+        Course.objects.filter(course_id='000003').update(evals_scraped=True)
+
+        self.assertEqual(self.reimport_subject('COS'), [])
+        self.import_pages.assert_called_once_with(1174, ['000003'],
+                                                  ['000001'])
+
+    def test_evals_rescraped_until_published(self):
+        self.import_subject('COS')
+        with mock.patch.object(scrapers, 'fetch',
+                               return_value=read_page('evals.html')), \
+                mock.patch.object(scrapers, 'parse_evals',
+                                  return_value=({}, [])):
+            tasks.import_course_pages(1174, evals_ids=['000001'])
+        Course.objects.update(details_scraped=True)
+        self.assertFalse(Course.objects.get(course_id='000001').evals_scraped)
+
+        self.reimport_subject('COS')
+        self.import_pages.assert_called_once_with(1174, [], [
+            '000001', '000003'])
+
+    def test_course_pages_with_failure(self):
+        self.import_subject('COS')
+        pages = {
+            scrapers.REGISTRAR_BASE_URL: read_page('course_details.html'),
+            scrapers.EVALUATION_BASE_URL: read_page('evals.html'),
+        }
+
+        def fetch(url, params, ttl=0):
+            if params.get('courseid') == '000003':
+                raise requests.HTTPError('500 Server Error')
+            return pages[url]
+
+        ids = ['000001', '000003']
+        with mock.patch.object(scrapers, 'fetch', side_effect=fetch), \
+                mock.patch.object(tasks.import_details, 'delay') as details, \
+                mock.patch.object(tasks.import_evals, 'delay') as evals:
+            tasks.import_course_pages(1174, ids, ids)
+
+        # The failed page is retried on its own, and the rest are saved
+        details.assert_called_once_with(1174, '000003')
+        self.assertFalse(evals.called)
+        scraped = {c.course_id: (c.details_scraped, c.evals_scraped)
+                   for c in Course.objects.all()}
+        self.assertEqual(scraped, {'000001': (True, True),
+                                   '000003': (False, True)})
+        stats, comments = scrapers.parse_evals(read_page('evals.html'))
+        course = Course.objects.get(course_id='000001')
+        self.assertEqual(float(course.rating), tasks.overall_rating(
+            tasks.aggregate_evals(stats)))
+        self.assertEqual(course.advice.count(), len(comments))
+
+    def test_course_pages_with_stuck_host(self):
+        self.import_subject('COS')
+        stuck = threading.Event()
+        self.addCleanup(stuck.set)
+
+        def fetch(url, params, ttl=0):
+            if params.get('courseid') == '000003':
+                stuck.wait()
+            return read_page('course_details.html')
+
+        ids = ['000001', '000003']
+        with mock.patch.object(scrapers, 'fetch', side_effect=fetch), \
+                mock.patch.object(tasks, 'course_pages_time_limit',
+                                  return_value=0.5), \
+                mock.patch.object(tasks.import_details, 'delay') as details:
+            tasks.import_course_pages(1174, ids)
+
+        # The page that didn't arrive in time is queued on its own
+        details.assert_called_once_with(1174, '000003')
+        scraped = dict(Course.objects.values_list('course_id',
+                                                  'details_scraped'))
+        self.assertEqual(scraped, {'000001': True, '000003': False})
+
+    def test_course_pages_time_limit(self):
+        with self.settings(SCRAPER_CONCURRENCY=8):
+            self.assertEqual(tasks.course_pages_time_limit(0), 30)
+            self.assertEqual(tasks.course_pages_time_limit(8), 30)
+            self.assertEqual(tasks.course_pages_time_limit(9), 60)
+
+
+class ScheduleTest(SimpleTestCase):
+
+    def test_parses_registrar_times(self):
+        self.assertEqual(parse_time('03:00 PM'), datetime.time(15, 0))
+        self.assertEqual(parse_time('12:30 PM'), datetime.time(12, 30))
+        self.assertEqual(parse_time('09:05 AM'), datetime.time(9, 5))
+        self.assertEqual(parse_days('MTWThF'), ['M', 'T', 'W', 'Th', 'F'])
+
+    def test_meetings_conflict_when_overlapping(self):
+        lecture = meeting_mask(['M', 'W'], datetime.time(10),
+                               datetime.time(10, 50))
+        before = meeting_mask(['W'], datetime.time(9),
+                              datetime.time(10, 1))
+        after = meeting_mask(['M'], datetime.time(10, 50),
+                             datetime.time(12))
+        other_day = meeting_mask(['T', 'Th'], datetime.time(10),
+                                 datetime.time(10, 50))
+        self.assertTrue(lecture & before)
+        self.assertFalse(lecture & after)
+        self.assertFalse(lecture & other_day)
+        self.assertEqual(decode_mask(encode_mask(lecture)), lecture)
+
+    def test_generates_schedules(self):
+        def section(days, hour):
+            return encode_mask(meeting_mask(days, datetime.time(hour),
+                                            datetime.time(hour, 50)))
+
+        # 24 precepts at four different times, two of which clash
+        sections = [('A', 'Lecture', 'A-L01', section(['M', 'W'], 10))]
+        sections += [('A', 'Precept', 'A-P%02d' % i,
+                      section(['T'], 9 + i % 4)) for i in range(24)]
+        sections += [('B', 'Lecture', 'B-L01', section(['T'], 9)),
+                     ('B', 'Lecture', 'B-L02', section(['T'], 10))]
+        generator = ScheduleGenerator(section_options(sections), 100)
+        schedules = list(generator)
+
+        # B's lectures leave three precept times each, six of each precept
+        self.assertEqual(len(schedules), 6)
+        self.assertFalse(generator.truncated)
+        for schedule in schedules:
+            self.assertEqual(len(dict(schedule)[('A', 'Precept')]), 6)
+
+        generator = ScheduleGenerator(section_options(sections), 3)
+        self.assertLess(len(list(generator)), 6)
+        self.assertTrue(generator.truncated)
+
+
+class CourseViewSetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.term = Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+        cls.subject = Subject.objects.create(code='COS',
+                                             name='Computer Science')
+        for number in range(100, 130):
+            create_course(cls.term, cls.subject, str(number))
+        create_course(cls.term, cls.subject, '226',
+                      title='Algorithms and Data Structures',
+                      description='Fundamental data structures, including '
+                                  'stacks, queues and search trees.')
+        create_course(cls.term, cls.subject, '217',
+                      title='Introduction to Programming Systems',
+                      description='Data structures in C.')
+        update_search_vectors()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_query_count_is_constant(self):
+        for limit in (1, 10, 30):
+            with self.assertNumQueries(2):  # count, courses
+                response = self.client.get('/api/courses/',
+                                           {'limit': limit})
+            self.assertEqual(len(response.data['results']), limit)
+
+        course = response.data['results'][0]
+        self.assertEqual(course['primary_number'], 'COS 100')
+        self.assertEqual(course['rating'], '4.50')
+        self.assertNotIn('sections', course)
+        self.assertNotIn('description', course)
+
+    def test_full_list_query_count_is_constant(self):
+        # count, courses, instructors, sections, meetings, evals, evaluation
+        # aggregates, advice
+        for limit in (1, 10, 30):
+            with self.assertNumQueries(8):
+                response = self.client.get('/api/courses/',
+                                           {'limit': limit, 'view': 'full'})
+            self.assertEqual(len(response.data['results']), limit)
+
+        course = response.data['results'][0]
+        self.assertEqual(len(course['sections']), 2)
+        self.assertEqual(len(course['sections'][0]['meetings']), 1)
+        self.assertEqual(len(course['evaluations']), 2)
+        self.assertEqual(len(course['advice']), 1)
+        self.assertEqual(len(course['instructors']), 1)
+
+    def test_cursor_pagination(self):
+        numbers = []
+        url, params = '/api/courses/', {'limit': 7}
+        while url:
+            with self.assertNumQueries(2):  # count, courses
+                response = self.client.get(url, params)
+            self.assertEqual(response.data['count'], 32)
+            numbers += [c['primary_number'] for c in response.data['results']]
+            url, params = response.data['next'], {}
+
+        self.assertEqual(numbers, ['COS %d' % n for n in range(100, 130)] +
+                         ['COS 217', 'COS 226'])
+
+    def test_count_opt_out(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/courses/', {'count': 'false'})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 32)
+
+    def test_export(self):
+        # term; courses, instructors, sections, meetings, evals, evaluation
+        # aggregates, advice; and the empty chunk that ends the export
+        with self.assertNumQueries(9):
+            response = self.client.get('/api/terms/1174/export/')
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        courses = [json.loads(line) for line in lines]
+        self.assertEqual(len(courses), 32)
+        self.assertEqual(courses[0]['course_id'], '000100')
+        self.assertEqual(len(courses[0]['sections'][0]['meetings']), 1)
+        self.assertEqual(len(courses[0]['evaluations']), 2)
+
+    def test_export_chunked(self):
+        courses = CourseViewSet.queryset.filter(term=self.term)
+        with self.assertNumQueries(15):  # two chunks of 7, and an empty one
+            lines = list(export_courses(courses, chunk_size=20))
+        ids = [json.loads(line)['course_id'] for line in lines]
+        self.assertEqual(len(set(ids)), 32)
+
+    def test_courses_redirect_to_snapshot(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(
+                API_SNAPSHOT_REDIRECT=True,
+                SNAPSHOTS_STORAGE_OPTIONS={'location': directory,
+                                           'base_url': '/snapshots/'}):
+            build_snapshots(CourseViewSet.queryset)
+            name = courses_name(1174, term_version(self.term))
+            with open(os.path.join(directory, name)) as f:
+                self.assertEqual(len(json.load(f)), 32)
+
+            response = self.client.get('/api/terms/1174/courses/')
+            self.assertRedirects(response, '/snapshots/' + name,
+                                 fetch_redirect_response=False)
+
+            # Stale snapshots are bypassed until built again
+            Course.objects.filter(course_id='000100').update(
+                last_updated=datetime.datetime(2030, 1, 1, tzinfo=utc))
+            response = self.client.get('/api/terms/1174/courses/')
+            self.assertEqual(response.status_code, 200)
+            courses = json.loads(b''.join(response.streaming_content))
+            self.assertEqual(len(courses), 32)
+            self.assertEqual(courses[0]['course_id'], '000100')
+
+    def test_ordered_by_rating(self):
+        other = Subject.objects.create(code='MAT', name='Mathematics')
+        create_course(self.term, other, '200', rating=4.9)
+        Course.objects.filter(course_id='000110').update(rating=4.8)
+        Course.objects.filter(course_id='000120').update(rating=None)
+
+        response = self.client.get('/api/courses/', {
+            'term': 1174, 'subject': 'COS', 'ordering': '-rating'})
+        ratings = [c['rating'] for c in response.data['results']]
+        self.assertEqual(response.data['count'], 31)
+        self.assertEqual(response.data['results'][0]['course_id'], '000110')
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+
+    def test_search(self):
+        with self.assertNumQueries(2):  # count, courses
+            response = self.client.get('/api/courses/search/',
+                                       {'q': 'data structures'})
+        self.assertEqual([c['primary_number'] for c in
+                          response.data['results']], ['COS 226', 'COS 217'])
+
+        for text in ('algorithm', 'COS 226', 'cos226', 'lovelace 226'):
+            response = self.client.get('/api/courses/search/', {'q': text})
+            self.assertEqual(response.data['count'], 1, text)
+
+    def test_autocomplete(self):
+        cos = CourseNumber.objects.get(subject=self.subject, number='226')
+        egr = CourseNumber.objects.create(
+            subject=Subject.objects.create(code='EGR', name='Engineering'),
+            number='191')
+        cos.course.numbers.add(egr)
+        update_search_vectors([cos.course])
+
+        for text in ('COS 22', 'egr 191', 'algor struct', 'Lovel 226'):
+            response = self.client.get('/api/courses/autocomplete/',
+                                       {'q': text})
+            self.assertEqual([c['primary_number'] for c in response.data],
+                             ['COS 226'], text)
+
+        # Descriptions aren't suggested from
+        response = self.client.get('/api/courses/autocomplete/',
+                                   {'q': 'stacks'})
+        self.assertEqual(response.data, [])
+
+        response = self.client.get('/api/courses/autocomplete/', {'q': 'COS'})
+        self.assertEqual(len(response.data), 10)
+
+    def test_autocomplete_cached(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/courses/autocomplete/', {'q': 'algo'})
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/courses/autocomplete/',
+                                       {'q': 'algo'})
+        self.assertEqual(response.data[0]['primary_number'], 'COS 226')
+
+    def test_not_modified(self):
+        # Courses are versioned by when they were last updated
+        for url, queries in (('/api/courses/', 0),
+                             ('/api/courses/000105/', 1),
+                             ('/api/terms/', 0)):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_course_etag_follows_last_updated(self):
+        url = '/api/courses/000105/'
+        etag = self.client.get(url)['ETag']
+
+        # Reimporting other courses doesn't change the course
+        bump_generation(1174)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Course.objects.filter(course_id='000105').update(
+            last_updated=datetime.datetime(2017, 3, 1, tzinfo=utc))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_invalidated_by_term(self):
+        def queries(params):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get('/api/courses/', params)
+            self.assertEqual(response.status_code, 200)
+            return len(context)
+
+        for params in ({'term': 1174}, {}):
+            self.assertEqual(queries(params), 2)
+            self.assertEqual(queries(params), 0)
+
+        # Another term's import only invalidates unscoped responses
+        bump_generation(1172)
+        self.assertEqual(queries({'term': 1174}), 0)
+        self.assertEqual(queries({}), 2)
+
+        bump_generation(1174)
+        self.assertEqual(queries({'term': 1174}), 2)
+        self.assertEqual(queries({}), 2)
+
+    def test_request_generation(self):
+        factory = RequestFactory()
+        cache.set(generation_key(), 1)
+        cache.set(generation_key(1174), 2)
+        self.assertEqual(request_generation(factory.get(
+            '/api/courses/', {'term': '01174'})), 2)
+
+        # Requests with a bogus term aren't scoped to a term
+        self.assertEqual(request_generation(factory.get(
+            '/api/courses/', {'term': 'bogus'})), 1)
+
+    def test_search_requires_query(self):
+        response = self.client.get('/api/courses/search/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_compatible(self):
+        # Every course meets at the same times as COS 100, except this one
+        course = Course.objects.get(course_id='000101')
+        for section in course.sections.all():
+            meeting = section.meetings.get()
+            meeting.days = 'TTh'
+            meeting.save()
+            section.occupancy = encode_mask(section_mask([meeting]))
+            section.save()
+
+        response = self.client.get('/api/courses/compatible/', {
+            'term': 1174, 'sections': '4100L01,4100P01'})
+        self.assertEqual([c['course_id'] for c in response.data['results']],
+                         ['000101'])
+
+        # Either section of the others fits around a single one
+        response = self.client.get('/api/courses/compatible/', {
+            'term': 1174, 'sections': '4100L01'})
+        self.assertEqual(response.data['count'], 31)
+
+        response = self.client.get('/api/courses/compatible/', {
+            'term': 1174, 'sections': '4100L01,nonexistent'})
+        self.assertEqual(response.status_code, 400)
+
+        # A course that only fits thanks to a cancelled section doesn't count
+        Section.objects.filter(class_id='4102P01').update(
+            status=Section.STATUSES.CANCELLED)
+        response = self.client.get('/api/courses/compatible/', {
+            'term': 1174, 'sections': '4100L01', 'limit': 50})
+        course_ids = [c['course_id'] for c in response.data['results']]
+        self.assertEqual(len(course_ids), 30)
+        self.assertNotIn('000102', course_ids)
+
+        for term in ('', 'abc'):
+            response = self.client.get('/api/courses/compatible/', {
+                'term': term, 'sections': '4100L01'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('term', response.data)
+
+    def test_filtered_by_meeting_times(self):
+        meeting = Meeting.objects.get(section__class_id='4101L01')
+        meeting.days = 'TTh'
+        meeting.start_time = datetime.time(15)
+        meeting.end_time = datetime.time(16, 20)
+        meeting.save()
+
+        def course_ids(**params):
+            params.update(term=1174, limit=50)
+            with self.assertNumQueries(2):  # count, page
+                response = self.client.get('/api/courses/', params)
+            return [c['course_id'] for c in response.data['results']]
+
+        self.assertEqual(len(course_ids(days='MW')), 31)
+        self.assertEqual(len(course_ids(days='MTWThF')), 32)
+        self.assertEqual(course_ids(starts_after='13:00'), ['000101'])
+        self.assertEqual(len(course_ids(starts_after='10:00',
+                                        ends_before='14:20')), 31)
+        self.assertEqual(course_ids(days='MTTh', ends_before='16:30'), [])
+
+        response = self.client.get('/api/courses/', {'days': 'bogus'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_schedules(self):
+        response = self.client.get('/api/courses/schedules/', {
+            'term': 1174, 'courses': '000100,000102'})
+        lines = [json.loads(line) for line in
+                 b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(lines[-1], {'count': 2, 'truncated': False})
+        self.assertEqual(lines[0]['sections'], [
+            {'course_id': '000100', 'type': 'Lecture',
+             'class_ids': ['4100L01']},
+            {'course_id': '000102', 'type': 'Lecture',
+             'class_ids': ['4102P01']},
+        ])
+
+        response = self.client.get('/api/courses/schedules/', {
+            'term': 1174, 'courses': '000100,000102', 'limit': 1})
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(json.loads(lines[-1]),
+                         {'count': 1, 'truncated': True})
+
+        response = self.client.get('/api/courses/schedules/', {
+            'term': 1174, 'courses': '000100,nonexistent'})
+        self.assertEqual(response.status_code, 400)
+
+        for term in ('', 'abc'):
+            response = self.client.get('/api/courses/schedules/', {
+                'term': term, 'courses': '000100,000102'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('term', response.data)
+
+        # A course whose every section is cancelled can't be scheduled
+        Section.objects.filter(course__course_id='000102').update(
+            status=Section.STATUSES.CANCELLED)
+        response = self.client.get('/api/courses/schedules/', {
+            'term': 1174, 'courses': '000100,000102'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('000102', response.data['courses'])
+
+    def test_history(self):
+        fall = Term.objects.create(
+            suffix='F2016', name='Fall 2016', code=1172,
+            start_date=datetime.date(2016, 9, 14),
+            end_date=datetime.date(2017, 1, 20))
+        create_course(fall, self.subject, '105', rating=3.5)
+        # Renumbered in an earlier term, but cross-listed as COS 105 there
+        old = create_course(fall, Subject.objects.create(code='EGR',
+                                                         name='Engineering'),
+                            '999', rating=3.0)
+        old.term = Term.objects.create(
+            suffix='S2016', name='Spring 2016', code=1164,
+            start_date=datetime.date(2016, 2, 1),
+            end_date=datetime.date(2016, 6, 1))
+        old.save()
+        old.numbers.add(CourseNumber.objects.get(subject=self.subject,
+                                                 number='105'))
+
+        with self.assertNumQueries(3):  # latest offering, offerings, aggs
+            response = self.client.get('/api/courses/000105/history/')
+        self.assertEqual([(c['term'], c['rating']) for c in response.data],
+                         [(1164, '3.00'), (1172, '3.50'), (1174, '4.50')])
+
+    def test_detail_query_count(self):
+        with self.assertNumQueries(8):  # version, course, relations
+            response = self.client.get('/api/courses/000105/')
+        self.assertEqual(response.data['title'], 'COS 105')
+        self.assertEqual(len(response.data['sections']), 2)
+
+
+class AdviceSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        term = Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+        cos = Subject.objects.create(code='COS', name='Computer Science')
+        mat = Subject.objects.create(code='MAT', name='Mathematics')
+        courses = [create_course(term, cos, '226'),
+                   create_course(term, mat, '201')]
+        courses[1].advice.create(text='The problem sets <b>are</b> long, '
+                                      'but the lectures are great & fun.')
+        courses[1].advice.create(text='Go to office hours.')
+        update_advice_vectors(courses)
+
+    def test_search(self):
+        with self.assertNumQueries(2):  # count, advice
+            response = self.client.get('/api/advice/',
+                                       {'q': 'problem sets'})
+        self.assertEqual(response.data['count'], 3)
+
+        response = self.client.get('/api/advice/', {'q': 'lecture'})
+        advice = response.data['results'][0]
+        self.assertEqual(advice['primary_number'], 'MAT 201')
+        self.assertEqual(advice['term'], 1174)
+        self.assertIn('&lt;b&gt;are&lt;/b&gt;', advice['snippet'])
+        self.assertIn('<mark>lectures</mark>', advice['snippet'])
+
+    def test_filters(self):
+        for params, count in (({'subject': 'COS'}, 1),
+                              ({'course': '000201'}, 2),
+                              ({'term': 1172}, 0)):
+            params['q'] = 'problem sets'
+            response = self.client.get('/api/advice/', params)
+            self.assertEqual(response.data['count'], count, params)
+
+    def test_requires_query(self):
+        response = self.client.get('/api/advice/')
+        self.assertEqual(response.status_code, 400)
+
+
+class SnapshotTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        storage = override_settings(SNAPSHOTS_STORAGE_OPTIONS={
+            'location': self.directory, 'base_url': '/snapshots/'})
+        storage.enable()
+        self.addCleanup(storage.disable)
+        cache.clear()
+
+    def create_term(self):
+        return Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name)) as f:
+            return json.load(f)
+
+    def build(self, force=False):
+        """Builds the snapshots, returning the codes of the terms written."""
+        return [term.code for term in build_snapshots(
+            CourseViewSet.queryset, force=force)]
+
+    def test_empty(self):
+        self.build()
+        self.assertEqual(self.read('terms.json'), [])
+        self.assertEqual(self.read('subjects.json'), [])
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     'manifest.json')))
+
+        # A term without courses yet
+        self.create_term()
+        self.assertEqual(self.build(), [1174])
+        self.assertEqual(self.read(courses_name(1174, None)), [])
+        self.assertEqual(self.read('manifest.json'), {'1174': None})
+
+    def test_only_changed_terms_rebuilt(self):
+        term = self.create_term()
+        create_course(term, Subject.objects.create(
+            code='COS', name='Computer Science'), '126')
+        self.assertEqual(self.build(), [1174])
+        old_name = courses_name(1174, term_version(term))
+        self.assertEqual(self.build(), [])
+        self.assertEqual(self.build(force=True), [1174])
+
+        # The new version replaces the old one
+        Course.objects.update(
+            last_updated=datetime.datetime(2030, 1, 1, tzinfo=utc))
+        self.assertEqual(self.build(), [1174])
+        name = courses_name(1174, term_version(term))
+        self.assertNotEqual(name, old_name)
+        self.assertEqual(len(self.read(name)), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     old_name)))
+
+    @override_settings(API_SNAPSHOT_REDIRECT=True, SNAPSHOT_DELAY=60)
+    def test_rebuilt_once_after_imports(self):
+        self.create_term()
+        with mock.patch.object(tasks.snapshot_term, 'apply_async') as queue:
+            tasks.queue_snapshot(1174)
+            tasks.queue_snapshot(1174)
+            queue.assert_called_once_with((1174,), countdown=60)
+
+            tasks.snapshot_term(1174)
+            self.assertEqual(self.read('manifest.json'), {'1174': None})
+            tasks.queue_snapshot(1174)
+            self.assertEqual(queue.call_count, 2)
+
+    def test_not_rebuilt_unless_served(self):
+        with mock.patch.object(tasks.snapshot_term, 'apply_async') as queue:
+            tasks.queue_snapshot(1174)
+        self.assertFalse(queue.called)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ExportEvalsTest(TestCase):
+
+    def setUp(self):
+        self.term = Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+        Term.objects.create(
+            suffix='F2016', name='Fall 2016', code=1172,
+            start_date=datetime.date(2016, 9, 14),
+            end_date=datetime.date(2017, 1, 20))
+        create_course(self.term, Subject.objects.create(
+            code='MAT', name='Mathematics'), '201')
+        create_course(self.term, Subject.objects.create(
+            code='COS', name='Computer Science'), '226')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, *args):
+        stdout = StringIO()
+        call_command('export_evals', self.directory, '--chunk-size', '3',
+                     *args, stdout=stdout)
+        return stdout.getvalue().splitlines()
+
+    def test_export(self):
+        self.assertEqual(self.export(), [
+            'exported 0 evaluations in term 1172',
+            'exported 4 evaluations in term 1174',
+        ])
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['1172'], {
+            'file': '1172.npz', 'rows': 0, 'version': None})
+        self.assertEqual(manifest['1174']['rows'], 4)
+
+        arrays = numpy.load(os.path.join(self.directory, '1174.npz'))
+        for name in ('course_id', 'term', 'subject', 'number', 'title',
+                     'instructors', 'question_text', 'response_avg',
+                     'question'):
+            self.assertEqual(arrays[name].shape, (4,), name)
+        self.assertEqual(arrays['term'].dtype, numpy.int16)
+        self.assertEqual(arrays['response_avg'].dtype, numpy.float32)
+
+        # Ordered by course, then question
+        self.assertEqual(list(arrays['course_id']),
+                         ['000226', '000226', '000201', '000201'])
+        self.assertEqual(list(arrays['subject']),
+                         ['COS', 'COS', 'MAT', 'MAT'])
+        self.assertEqual(list(arrays['question']),
+                         ['overall', 'lectures', 'overall', 'lectures'])
+        self.assertEqual(list(arrays['response_avg']),
+                         [4.5, 4.0, 4.5, 4.0])
+        self.assertEqual(set(arrays['instructors']), {'Ada Lovelace'})
+        self.assertEqual(set(arrays['term']), {1174})
+
+        arrays = numpy.load(os.path.join(self.directory, '1172.npz'))
+        self.assertEqual(arrays['course_id'].shape, (0,))
+
+    def test_incremental(self):
+        self.export()
+        self.assertEqual(self.export('--incremental'), [])
+
+        Course.objects.filter(course_id='000201').update(
+            last_updated=datetime.datetime(2030, 1, 1, tzinfo=utc))
+        self.assertEqual(self.export('--incremental'), [
+            'exported 4 evaluations in term 1174',
+        ])
+
+
+class EnrollmentHistoryTest(TestCase):
+
+    def setUp(self):
+        self.term = Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+        cache.clear()
+
+    def snapshot(self, days_ago, hour, enrollment, class_id='41234'):
+        time = now() - datetime.timedelta(days=days_ago)
+        EnrollmentSnapshot.objects.create(
+            term=self.term, class_id=class_id, enrollment=enrollment,
+            capacity=100, status='Open',
+            time=time.replace(hour=hour, minute=0, second=0, microsecond=0))
+
+    def test_compacted_to_daily(self):
+        for days_ago, hour, enrollment in ((40, 9, 10), (40, 12, 20),
+                                           (40, 18, 30), (39, 9, 40),
+                                           (1, 9, 50), (1, 12, 60)):
+            self.snapshot(days_ago, hour, enrollment)
+        self.snapshot(40, 9, 5, class_id='45678')
+        tasks.compact_enrollment_history()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/enrollment/', {
+                'term': 1174, 'section': '41234'})
+        self.assertEqual([s['enrollment'] for s in response.data],
+                         [30, 40, 50, 60])
+        self.assertEqual(EnrollmentSnapshot.objects.count(), 5)
+
+    def test_requires_section(self):
+        response = self.client.get('/api/enrollment/', {'term': 1174})
+        self.assertEqual(response.status_code, 400)
+
+
+class EnrollmentRefreshTest(TestCase):
+
+    def setUp(self):
+        term = Term.objects.create(
+            suffix='S2017', name='Spring 2017', code=1174,
+            start_date=datetime.date(2017, 2, 6),
+            end_date=datetime.date(2017, 6, 6))
+        subject = Subject.objects.create(code='COS', name='Computer Science')
+        for number in ('126', '226'):
+            create_course(term, subject, number)
+        self.last_updated = datetime.datetime(2017, 1, 1)
+        Course.objects.update(last_updated=self.last_updated)
+        cache.clear()
+
+        # Enrollment, capacity and status of each section, by course and class
+        self.sections = {
+            ('000126', '4126L01'): (10, 20, 'Open'),
+            ('000126', '4126P01'): (10, 20, 'Open'),
+            ('000226', '4226L01'): (10, 20, 'Open'),
+            ('000226', '4226P01'): (10, 20, 'Open'),
+        }
+
+    def refresh(self):
+        """Refreshes COS from a feed of self.sections, returning the SQL."""
+        feed = {}
+        for (course_id, class_id), numbers in sorted(self.sections.items()):
+            enrollment, capacity, status = numbers
+            feed.setdefault(course_id, []).append({
+                'class_number': class_id,
+                'enrollment': str(enrollment),
+                'capacity': str(capacity),
+                'status': status,
+            })
+        courses = [{'course_id': course_id, 'classes': classes}
+                   for course_id, classes in sorted(feed.items())]
+        with mock.patch.object(tasks, 'scrape_courses',
+                               return_value=courses) as scrape, \
+                CaptureQueriesContext(connection) as context:
+            tasks.refresh_enrollments_in_subject(1174, 'COS')
+        scrape.assert_called_once_with(1174, 'COS', ttl=0)
+        return [query['sql'] for query in context.captured_queries]
+
+    def history(self, class_id):
+        return list(EnrollmentSnapshot.objects.filter(
+            class_id=class_id).order_by('time').values_list(
+            'enrollment', 'capacity', 'status'))
+
+    def test_first_refresh_starts_history(self):
+        generation = get_generation(1174)
+        self.refresh()
+
+        # Nothing changed, but every section's history starts here
+        for _, class_id in self.sections:
+            self.assertEqual(self.history(class_id), [(10, 20, 'Open')])
+        self.assertEqual(set(Course.objects.values_list(
+            'last_updated', flat=True)), {self.last_updated})
+        self.assertNotEqual(get_generation(1174), generation)
+
+    def test_only_changed_sections_written(self):
+        self.refresh()
+        generation = get_generation(1174)
+
+        self.sections['000126', '4126L01'] = (20, 20, 'Closed')
+        self.sections['000126', '4126L02'] = (5, 20, 'Open')  # new section
+        self.sections['000999', '4999L01'] = (5, 20, 'Open')  # new course
+        self.refresh()
+
+        section = Section.objects.get(class_id='4126L01')
+        self.assertEqual((section.enrollment, section.capacity,
+                          section.status), (20, 20, 'Closed'))
+        self.assertEqual(self.history('4126L01'),
+                         [(10, 20, 'Open'), (20, 20, 'Closed')])
+        for class_id in ('4126P01', '4226L01', '4226P01'):
+            self.assertEqual(self.history(class_id), [(10, 20, 'Open')])
+        for _, class_id in self.sections:
+            if class_id not in ('4126L01', '4126L02', '4999L01'):
+                self.assertEqual(Section.objects.get(
+                    class_id=class_id).enrollment, 10)
+        for class_id in ('4126L02', '4999L01'):
+            self.assertFalse(Section.objects.filter(class_id=class_id))
+            self.assertEqual(self.history(class_id), [])
+
+        self.assertGreater(
+            Course.objects.get(course_id='000126').last_updated,
+            self.last_updated)
+        self.assertEqual(Course.objects.get(course_id='000226').last_updated,
+                         self.last_updated)
+        self.assertNotEqual(get_generation(1174), generation)
+
+    def test_nothing_written_if_unchanged(self):
+        self.refresh()
+        generation = get_generation(1174)
+
+        queries = self.refresh()
+        self.assertFalse([sql for sql in queries
+                          if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertEqual(EnrollmentSnapshot.objects.count(), 4)
+        self.assertEqual(get_generation(1174), generation)
+
+    @override_settings(ENROLLMENT_REFRESH_INTERVAL=300)
+    def test_refresh_every_subject(self):
+        Subject.objects.create(code='MAT', name='Mathematics')
+        with mock.patch.object(tasks, 'scrape_term',
+                               return_value=[{'code': '1174'}]), \
+                mock.patch.object(tasks, 'group') as group:
+            tasks.refresh_enrollments()
+
+        signatures = sorted(group.call_args[0][0], key=lambda s: s.args)
+        self.assertEqual([s.args for s in signatures],
+                         [('1174', 'COS'), ('1174', 'MAT')])
+        for signature in signatures:
+            self.assertEqual(signature.task,
+                             tasks.refresh_enrollments_in_subject.name)
+            self.assertEqual(signature.options['expires'], 300)
+
+    def test_no_refresh_before_import(self):
+        with mock.patch.object(tasks, 'scrape_term',
+                               return_value=[{'code': '1182'}]), \
+                mock.patch.object(tasks, 'group') as group:
+            tasks.refresh_enrollments()
+        self.assertFalse(group.called)
@@ -22,5 +22,8 @@ router = routers.DefaultRouter()
 router.register(r'terms', views.TermViewSet)
 router.register(r'subjects', views.SubjectViewSet)
 router.register(r'courses', views.CourseViewSet)
+router.register(r'advice', views.AdviceSearchViewSet, base_name='advice')
+router.register(r'enrollment', views.EnrollmentHistoryViewSet,
+                base_name='enrollment')
 
 urlpatterns = router.urls
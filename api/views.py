@@ -1,27 +1,335 @@
+from django.conf import settings
+from django.db.models import Max, Prefetch
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
 from django.shortcuts import render
-from rest_framework import generics, viewsets
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import generics, mixins, viewsets
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
 
+from caching import CachedResponseMixin, ConditionalGetMixin
+from export import NDJSON_CONTENT_TYPE, export_courses
+import filters
 import models
+from pagination import CoursePagination
 import serializers
+from schedules import ScheduleGenerator, conflicting_courses, decode_mask
+from schedules import section_options
+from search import autocomplete_courses, search_advice, search_courses
+from snapshots import courses_url, iter_courses
 
 
-class TermViewSet(viewsets.ReadOnlyModelViewSet):
+class TermViewSet(ConditionalGetMixin, CachedResponseMixin,
+                  viewsets.ReadOnlyModelViewSet):
+
+    """
+    Lists and retrieves terms. Exporting a term streams all of its courses in
+    full as NDJSON, and listing its courses returns them all in full at once,
+    from its static snapshot if API_SNAPSHOT_REDIRECT is set.
+    """
 
     queryset = models.Term.objects.all()
     serializer_class = serializers.TermSerializer
     lookup_field = 'code'
 
+    @detail_route()
+    def export(self, request, code=None):
+        term = self.get_object()
+        courses = CourseViewSet.queryset.filter(term=term)
+        response = StreamingHttpResponse(export_courses(courses),
+                                         content_type=NDJSON_CONTENT_TYPE)
+        response['Content-Disposition'] = \
+            'attachment; filename="%s.ndjson"' % term.code
+        return response
+
+    @detail_route()
+    def courses(self, request, code=None):
+        term = self.get_object()
+        if settings.API_SNAPSHOT_REDIRECT:
+            url = courses_url(term)
+            if url is not None:
+                return redirect(url)
+
+        # Serialize a chunk of courses at a time, as the snapshots do, so
+        # the whole term is never held in memory at once
+        courses = CourseViewSet.queryset.filter(term=term) \
+            .order_by('sort_key')
+        return StreamingHttpResponse(iter_courses(courses),
+                                     content_type='application/json')
 
-class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
+
+class SubjectViewSet(ConditionalGetMixin, CachedResponseMixin,
+                     viewsets.ReadOnlyModelViewSet):
 
     queryset = models.Subject.objects.all()
     serializer_class = serializers.SubjectSerializer
     lookup_field = 'code'
 
 
-class CourseViewSet(viewsets.ReadOnlyModelViewSet):
+class CourseViewSet(ConditionalGetMixin, CachedResponseMixin,
+                    viewsets.ReadOnlyModelViewSet):
+
+    """
+    Lists courses in a compact form, unless ?view=full is given, and
+    retrieves them in full. Listings can be filtered by ?term= and ?subject=,
+    and ordered by ?ordering=-rating to rank them. Searching by ?q= lists
+    matching courses best match first, and autocompleting by ?q= suggests
+    courses by the start of their titles, numbers and instructor names. The
+    history of a course lists its offerings in every term, oldest first.
+    Given the ?sections= chosen in a ?term=, by comma-separated class ids,
+    compatible lists the other courses that can still be taken with them.
+    Given ?courses= in a ?term=, by comma-separated course ids, schedules
+    streams the conflict-free ways of taking them all as NDJSON.
+    """
 
-    queryset = models.Course.objects.all()
+    # Fetch every nested relation up front, so that the number of queries
+    # doesn't grow with the number of courses
+    queryset = models.Course.objects.select_related(
+        'term',
+        'primary_number__subject',
+    ).prefetch_related(
+        Prefetch('instructors'),
+        Prefetch('sections', queryset=models.Section.objects.prefetch_related(
+            Prefetch('meetings'),
+        )),
+        Prefetch('evaluations'),
+        Prefetch('evaluation_aggregates'),
+        Prefetch('advice', queryset=models.Advice.objects.defer(
+            'search_vector',
+        )),
+    ).defer(
+        'search_vector',
+    )
+    list_queryset = models.Course.objects.select_related(
+        'primary_number__subject',
+    ).defer(
+        'description',
+        'additional_info',
+        'search_vector',
+    )
     serializer_class = serializers.CourseSerializer
+    filter_backends = (DjangoFilterBackend, filters.CourseOrderingFilter)
+    filter_class = filters.CourseFilter
+    ordering_fields = ('rating', 'title')
+    ordering = ('sort_key',)
+    pagination_class = CoursePagination
     # TODO: figure out how to require term AND course id
     lookup_field = 'course_id'
+
+    def is_compact(self):
+        return (self.action in ('list', 'search', 'autocomplete',
+                                'compatible') and
+                self.request.query_params.get('view') != 'full')
+
+    def get_queryset(self):
+        if self.is_compact():
+            return self.list_queryset.all()
+        return super(CourseViewSet, self).get_queryset()
+
+    @property
+    def paginator(self):
+        # Search results are ordered by rank, which can't be paged by cursor
+        if not hasattr(self, '_paginator') and self.action == 'search':
+            self._paginator = LimitOffsetPagination()
+        return super(CourseViewSet, self).paginator
+
+    def get_version(self, request, *args, **kwargs):
+        # A course only changes when it's reimported, whatever else is. The
+        # action isn't set yet, since this runs before the request is handled.
+        if self.action_map.get(request.method.lower()) == 'retrieve':
+            return models.Course.objects.filter(
+                course_id=kwargs['course_id'],
+            ).aggregate(Max('last_updated'))['last_updated__max']
+        return super(CourseViewSet, self).get_version(request, *args,
+                                                      **kwargs)
+
+    def get_serializer_class(self):
+        if self.is_compact():
+            return serializers.CourseListSerializer
+        return super(CourseViewSet, self).get_serializer_class()
+
+    @list_route()
+    def search(self, request):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This parameter is required.'})
+
+        # Ordering by rank replaces any requested ordering
+        queryset = search_courses(self.filter_queryset(self.get_queryset()),
+                                  text)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @list_route()
+    def autocomplete(self, request):
+        queryset = autocomplete_courses(
+            self.filter_queryset(self.get_queryset()),
+            request.query_params.get('q', ''),
+        )[:settings.AUTOCOMPLETE_LIMIT]
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def get_term_code(self, request):
+        """Returns the code of the term given by ?term=, which is required."""
+        term = request.query_params.get('term', '').strip()
+        if not term:
+            raise ValidationError({'term': 'This parameter is required.'})
+        try:
+            return int(term)
+        except ValueError:
+            raise ValidationError({'term': 'A valid integer is required.'})
+
+    @list_route()
+    def compatible(self, request):
+        term = self.get_term_code(request)
+        class_ids = [class_id.strip() for class_id in
+                     request.query_params.get('sections', '').split(',')
+                     if class_id.strip()]
+        if not class_ids:
+            raise ValidationError({'sections': 'This parameter is required.'})
+
+        sections = models.Section.objects.filter(course__term__code=term)
+        chosen = list(sections.filter(class_id__in=class_ids).values_list(
+            'class_id', 'course', 'occupancy'))
+        missing = set(class_ids) - set(row[0] for row in chosen)
+        if missing:
+            raise ValidationError({'sections': 'Unknown sections: %s.' %
+                                   ', '.join(sorted(missing))})
+
+        mask = 0
+        for _, _, occupancy in chosen:
+            mask |= decode_mask(occupancy)
+        # Cancelled sections can't be taken, so they don't make a course fit
+        excluded = conflicting_courses(sections.exclude(
+            status=models.Section.STATUSES.CANCELLED,
+        ).values_list('course', 'type', 'occupancy'), mask)
+        excluded.update(row[1] for row in chosen)
+
+        queryset = self.filter_queryset(self.get_queryset()).exclude(
+            pk__in=excluded)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @list_route()
+    def schedules(self, request):
+        term = self.get_term_code(request)
+        course_ids = [course_id.strip() for course_id in
+                      request.query_params.get('courses', '').split(',')
+                      if course_id.strip()]
+        if not course_ids:
+            raise ValidationError({'courses': 'This parameter is required.'})
+        try:
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        if not 0 < limit < settings.SCHEDULE_LIMIT:
+            limit = settings.SCHEDULE_LIMIT
+
+        found = set(models.Course.objects.filter(
+            term__code=term, course_id__in=course_ids,
+        ).values_list('course_id', flat=True))
+        missing = set(course_ids) - found
+        if missing:
+            raise ValidationError({'courses': 'Unknown courses: %s.' %
+                                   ', '.join(sorted(missing))})
+
+        sections = models.Section.objects.filter(
+            course__term__code=term,
+            course__course_id__in=course_ids,
+        ).exclude(
+            status=models.Section.STATUSES.CANCELLED,
+        ).values_list('course__course_id', 'type', 'class_id', 'occupancy')
+        options = section_options(sections)
+
+        # Courses without a section that isn't cancelled can't be taken
+        unschedulable = set(course_ids) - set(
+            course_id for course_id, _ in options)
+        if unschedulable:
+            raise ValidationError({'courses': 'No sections to take in: %s.' %
+                                   ', '.join(sorted(unschedulable))})
+
+        generator = ScheduleGenerator(options, settings.SCHEDULE_MAX_STEPS)
+        return StreamingHttpResponse(generator.stream(limit),
+                                     content_type=NDJSON_CONTENT_TYPE)
+
+    @detail_route()
+    def history(self, request, course_id=None):
+        # Course ids are reused across terms, so start from the latest
+        course = models.Course.objects.filter(
+            course_id=course_id,
+        ).order_by('-term__code').first()
+        if course is None:
+            raise Http404
+
+        offerings = course.offerings().select_related(
+            'term',
+            'primary_number__subject',
+        ).prefetch_related(
+            Prefetch('evaluation_aggregates'),
+        ).order_by('term__code')
+        serializer = serializers.CourseHistorySerializer(offerings, many=True)
+        return Response(serializer.data)
+
+
+class AdviceSearchViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+
+    """
+    Searches advice by ?q=, best match first, with highlighted snippets.
+    Results can be filtered by ?term=, ?subject= and ?course=.
+    """
+
+    queryset = models.Advice.objects.select_related(
+        'course__term',
+        'course__primary_number__subject',
+    ).only(
+        'course__course_id',
+        'course__term__code',
+        'course__primary_number__number',
+        'course__primary_number__subject__code',
+    )
+    serializer_class = serializers.AdviceSearchSerializer
+    filter_class = filters.AdviceFilter
+
+    def get_queryset(self):
+        text = self.request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This parameter is required.'})
+        return search_advice(self.queryset.all(), text)
+
+
+class EnrollmentHistoryViewSet(ConditionalGetMixin, CachedResponseMixin,
+                               mixins.ListModelMixin,
+                               viewsets.GenericViewSet):
+
+    """
+    Lists the enrollment history of the section with class id ?section= in
+    ?term=, oldest first: a snapshot each time its numbers changed, and only
+    the last of each day once they're old enough.
+    """
+
+    queryset = models.EnrollmentSnapshot.objects.only(
+        'time',
+        'enrollment',
+        'capacity',
+        'status',
+    ).order_by('time')
+    serializer_class = serializers.EnrollmentSnapshotSerializer
+    pagination_class = None
+    filter_backends = ()
+
+    def get_queryset(self):
+        params = self.request.query_params
+        for name in ('term', 'section'):
+            if not params.get(name, '').strip():
+                raise ValidationError({name: 'This parameter is required.'})
+        try:
+            term = int(params['term'])
+        except ValueError:
+            raise ValidationError({'term': 'A valid integer is required.'})
+        return self.queryset.filter(term__code=term,
+                                    class_id=params['section'].strip())
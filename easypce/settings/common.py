@@ -36,6 +36,7 @@ DJANGO_APPS = (
     'django.contrib.sites',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Useful template tags:
     # 'django.contrib.humanize',
@@ -188,10 +189,24 @@ STATIC_ROOT = str(ROOT('staticfiles'))
 # https://docs.djangoproject.com/en/dev/ref/settings/#static-url
 STATIC_URL = '/static/'
 
+# Directory JSON snapshots of the API are built into in development, where
+# they're served along with the static files
+SNAPSHOTS_DIR = str(ROOT('snapshots'))
+
+# Storage JSON snapshots of the API are written to by the worker and served
+# from. In production, it must be shared with the web servers, such as S3.
+SNAPSHOTS_STORAGE = env('SNAPSHOTS_STORAGE',
+                        default='django.core.files.storage.FileSystemStorage')
+SNAPSHOTS_STORAGE_OPTIONS = {
+    'location': SNAPSHOTS_DIR,
+    'base_url': STATIC_URL + 'snapshots/',
+}
+
 # https://docs.djangoproject.com/en/dev/ref/contrib/staticfiles/
 #    #std:setting-STATICFILES_DIRS
 STATICFILES_DIRS = (
     ROOT('static'),
+    ('snapshots', SNAPSHOTS_DIR),
 )
 
 # https://docs.djangoproject.com/en/dev/ref/contrib/staticfiles/#staticfiles-finders
@@ -256,6 +271,58 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Seconds between refreshes of section enrollments in the current term, or 0
+# not to refresh them. Set this during course selection, when they change by
+# the minute. Refreshes that are still queued when the next one is due are
+# dropped rather than piling up.
+ENROLLMENT_REFRESH_INTERVAL = env.int('ENROLLMENT_REFRESH_INTERVAL', default=0)
+
+# Days to keep every enrollment change for, after which the history of each
+# section is rolled up into its last enrollment of each day
+ENROLLMENT_HISTORY_RETENTION = env.int('ENROLLMENT_HISTORY_RETENTION',
+                                       default=14)
+
+CELERY_BEAT_SCHEDULE = {
+    'compact-enrollment-history': {
+        'task': 'api.tasks.compact_enrollment_history',
+        'schedule': 24 * 60 * 60,
+    },
+}
+if ENROLLMENT_REFRESH_INTERVAL:
+    CELERY_BEAT_SCHEDULE['refresh-enrollments'] = {
+        'task': 'api.tasks.refresh_enrollments',
+        'schedule': ENROLLMENT_REFRESH_INTERVAL,
+        'options': {'expires': ENROLLMENT_REFRESH_INTERVAL},
+    }
+
+# SCRAPER CONFIGURATION
+# ------------------------------------------------------------------------------
+
+# Seconds to wait for a connection to, and then a response from, the registrar
+SCRAPER_CONNECT_TIMEOUT = env.float('SCRAPER_CONNECT_TIMEOUT', default=5.0)
+SCRAPER_READ_TIMEOUT = env.float('SCRAPER_READ_TIMEOUT', default=30.0)
+
+# Maximum number of concurrent requests to any one host, per process
+SCRAPER_MAX_CONNECTIONS_PER_HOST = env.int('SCRAPER_MAX_CONNECTIONS_PER_HOST',
+                                           default=4)
+
+# Number of times to retry failed connections and server errors
+SCRAPER_RETRIES = env.int('SCRAPER_RETRIES', default=3)
+
+# Directory to cache scraped pages in, if any, and its maximum size in bytes
+SCRAPER_CACHE_DIR = env('SCRAPER_CACHE_DIR', default='')
+SCRAPER_CACHE_MAX_SIZE = env.int('SCRAPER_CACHE_MAX_SIZE',
+                                 default=512 * 1024 * 1024)
+
+# BeautifulSoup parser used to scrape pages. html5lib is used as a fallback
+# whenever this parser fails on a page.
+SCRAPER_PARSER = env('SCRAPER_PARSER', default='lxml')
+
+# Number of pages a worker scrapes at once, and how many scraped pages are
+# saved to the database at a time
+SCRAPER_CONCURRENCY = env.int('SCRAPER_CONCURRENCY', default=8)
+SCRAPER_BATCH_SIZE = env.int('SCRAPER_BATCH_SIZE', default=50)
+
 # SENTRY CONFIGURATION
 # ------------------------------------------------------------------------------
 
@@ -291,3 +358,28 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.'
                                 'DjangoFilterBackend',)
 }
+
+# API CONFIGURATION
+# ------------------------------------------------------------------------------
+
+# Number of suggestions the autocomplete endpoint returns
+AUTOCOMPLETE_LIMIT = env.int('AUTOCOMPLETE_LIMIT', default=10)
+
+# Seconds to cache API responses for. Responses are invalidated whenever the
+# data they depend on is reimported, so this only bounds the cache's size.
+API_CACHE_TTL = env.int('API_CACHE_TTL', default=7 * 24 * 60 * 60)
+
+# Maximum number of schedules the schedule generator returns per request
+SCHEDULE_LIMIT = env.int('SCHEDULE_LIMIT', default=100)
+
+# Number of section choices the schedule generator tries before giving up,
+# which bounds the time a request can take
+SCHEDULE_MAX_STEPS = env.int('SCHEDULE_MAX_STEPS', default=20000)
+
+# Whether to redirect requests for the courses of a term to its static
+# snapshot, when one of its current data has been built
+API_SNAPSHOT_REDIRECT = env.bool('API_SNAPSHOT_REDIRECT', default=False)
+
+# Seconds to wait after an import before rebuilding the snapshot of its term,
+# so that the imports of every subject in the term are snapshotted together
+SNAPSHOT_DELAY = env.int('SNAPSHOT_DELAY', default=5 * 60)
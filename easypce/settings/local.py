@@ -36,6 +36,11 @@ CACHES = {
     }
 }
 
+# SCRAPING
+# ------------------------------------------------------------------------------
+# Cache scraped pages so that rescraping old terms is mostly free
+SCRAPER_CACHE_DIR = env('SCRAPER_CACHE_DIR', default=ROOT('.scraper-cache'))
+
 # CORS
 # ------------------------------------------------------------------------------
 
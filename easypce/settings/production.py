@@ -93,6 +93,10 @@ INSTALLED_APPS += ('gunicorn', )
 # # stored files.
 # MEDIA_URL = 'https://s3.amazonaws.com/%s/' % AWS_STORAGE_BUCKET_NAME
 
+# # Snapshots are built by the worker, so serve them from the bucket too
+# SNAPSHOTS_STORAGE = 'storages.backends.s3boto.S3BotoStorage'
+# SNAPSHOTS_STORAGE_OPTIONS = {'location': 'snapshots'}
+
 
 # Static Assets
 # ------------------------